@@ -0,0 +1,7 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+"""
+Offline benchmarks for the driver's hot paths. Run with `python -m benchmarks`
+from the repository root; see `python -m benchmarks --help` for options.
+"""
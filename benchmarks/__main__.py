@@ -0,0 +1,60 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import argparse
+from . import cases
+from .harness import compare, save
+
+SCRIPT_SIZES = [1024, 16 * 1024, 256 * 1024, 1024 * 1024]
+QUICK_SCRIPT_SIZES = [1024, 16 * 1024]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the Monocle driver's send, notify and line reassembly paths.")
+    parser.add_argument("--output", default="bench_output.json",
+                        help="Path to write JSON results to.")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON results from a previous run to compare against.")
+    parser.add_argument("--notify-packets", type=int, default=100000,
+                        help="Number of notification packets to feed _on_notify().")
+    parser.add_argument("--quick", action="store_true",
+                        help="Run only the small cases.")
+    args = parser.parse_args()
+
+    sizes = QUICK_SCRIPT_SIZES if args.quick else SCRIPT_SIZES
+    notify_counts = [min(args.notify_packets, 10000)] if args.quick else [args.notify_packets]
+
+    results = []
+    for size in sizes:
+        results.append(cases.bench_send(size))
+        results.append(cases.bench_batched(size))
+        results.append(cases.bench_batched(size, view=True))
+        results.append(cases.bench_line_reader(size))
+    for write_without_response in (False, True):
+        results.append(cases.bench_send(16 * 1024, latency=0.001,
+                                        write_without_response=write_without_response))
+    for count in notify_counts:
+        results.append(cases.bench_notify(count))
+
+    for result in results:
+        print("{:<40} {:>14.0f} B/s  {:>8.3f} s  peak {:>10} B  {:>8} blocks".format(
+            result["name"], result["bytes_per_sec"], result["seconds"],
+            result["peak_bytes"], result["net_allocated_blocks"]))
+        if "write_latency" in result:
+            print("{:<40} write latency {}".format("", ", ".join(
+                "{} {:.1f}us".format(point, value * 1e6)
+                for point, value in result["write_latency"].items())))
+
+    save(results, args.output)
+    print("Results written to {}".format(args.output))
+
+    if args.compare:
+        for name, metric, old, new, ratio in compare(results, args.compare):
+            print("{:<40} {:<16} {:>14.0f} -> {:>14.0f} ({:.2f}x)".format(
+                name, metric, old, new, ratio))
+
+
+if __name__ == "__main__":
+    main()
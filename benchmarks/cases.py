@@ -0,0 +1,136 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+from brilliant_monocle_driver import Monocle
+from brilliant_monocle_driver.batched import batched, batched_view
+from brilliant_monocle_driver.line_reader import LineReader
+from .harness import TimedTransport, measure, percentiles
+
+SCRIPT_LINE = "display.text('battery: {}'.format(device.battery_level()), 5, 5, 0xffffff)\n"
+DEVICE_LINE = "[EVENT:touch-A] sensor=0123456789abcdef value=42\r\n"
+
+
+def make_script(size):
+    """Build a MicroPython-looking script of roughly size bytes."""
+    return (SCRIPT_LINE * (size // len(SCRIPT_LINE) + 1))[:size]
+
+
+def make_packets(count, packet_size):
+    """Build count notification packets of a device printing DEVICE_LINE repeatedly."""
+    stream = (DEVICE_LINE * (count * packet_size // len(DEVICE_LINE) + 1)).encode()
+    return [bytearray(stream[i * packet_size:(i + 1) * packet_size]) for i in range(count)]
+
+
+def bench_send(size, latency=0.0, write_without_response=False):
+    """
+    Monocle.send() of a size-byte script through a simulated link with the given
+    per-packet latency.
+    """
+    script = make_script(size)
+    transports = []
+
+    async def run():
+        transport = TimedTransport(latency=latency)
+        transports.append(transport)
+        monocle = Monocle(transport=transport, write_without_response=write_without_response)
+        await monocle.connect()
+        await monocle.send(script)
+        await monocle.disconnect()
+
+    elapsed, _, allocations = measure(lambda: asyncio.run(run()))
+    transport = transports[0]
+    result = {
+        "name": "send/{}".format(size) + (
+            "/latency-{}ms".format(latency * 1000) if latency else "") + (
+            "/no-response" if write_without_response else ""),
+        "bytes": transport.bytes_written,
+        "writes": transport.packets_written,
+        "seconds": elapsed,
+        "bytes_per_sec": transport.bytes_written / elapsed,
+        "writes_per_sec": transport.packets_written / elapsed,
+        "write_latency": percentiles(transport.write_durations),
+    }
+    result.update(allocations)
+    return result
+
+
+def bench_batched(size, length=125, view=False):
+    """batched() (or batched_view() if view is True) over a size-byte payload."""
+    payload = make_script(size).encode()
+    chunker = batched_view if view else batched
+
+    def run():
+        count = 0
+        for _ in chunker(payload, length):
+            count += 1
+        return count
+
+    elapsed, chunks, allocations = measure(run)
+    result = {
+        "name": "{}/{}".format(chunker.__name__, size),
+        "bytes": size,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "bytes_per_sec": size / elapsed,
+    }
+    result.update(allocations)
+    return result
+
+
+def bench_notify(count, packet_size=125):
+    """Monocle._on_notify() fed count packets with a line listener installed."""
+    packets = make_packets(count, packet_size)
+    monocle = Monocle(transport=TimedTransport())
+    channel = monocle.transport.tx_characteristic
+    lines = []
+    monocle.add_line_listener(lambda line: lines.append(len(line)))
+
+    def run():
+        lines.clear()
+        for packet in packets:
+            monocle._on_notify(channel, packet)
+        return len(lines)
+
+    elapsed, line_count, allocations = measure(run)
+    result = {
+        "name": "notify/{}".format(count),
+        "packets": count,
+        "bytes": count * packet_size,
+        "lines": line_count,
+        "seconds": elapsed,
+        "bytes_per_sec": count * packet_size / elapsed,
+        "packets_per_sec": count / elapsed,
+    }
+    result.update(allocations)
+    return result
+
+
+def bench_line_reader(line_size, packet_size=20):
+    """
+    LineReader.input()/get_lines() reassembling one line of line_size bytes
+    that arrives in packet_size pieces, e.g. a long base64 dump.
+    """
+    text = "A" * line_size + "\r\n"
+    pieces = [text[i:i + packet_size] for i in range(0, len(text), packet_size)]
+
+    def run():
+        reader = LineReader("\r\n")
+        count = 0
+        for piece in pieces:
+            reader.input(piece)
+            count += len(reader.get_lines())
+        return count
+
+    elapsed, line_count, allocations = measure(run)
+    result = {
+        "name": "line_reader/{}".format(line_size),
+        "bytes": len(text),
+        "packets": len(pieces),
+        "lines": line_count,
+        "seconds": elapsed,
+        "bytes_per_sec": len(text) / elapsed,
+        "packets_per_sec": len(pieces) / elapsed,
+    }
+    result.update(allocations)
+    return result
@@ -0,0 +1,100 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from brilliant_monocle_driver import SimulatedTransport, __version__
+
+
+class TimedTransport(SimulatedTransport):
+    """
+    SimulatedTransport that records the wall-clock duration of every write.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(record_scripts=False, **kwargs)
+        self.write_durations = []
+
+    async def write(self, data, response=True):
+        start = time.perf_counter()
+        await super().write(data, response)
+        self.write_durations.append(time.perf_counter() - start)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Return a dict of the requested percentiles (nearest-rank) of samples.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        index = min(len(ordered) - 1, max(0, int(round(point / 100 * len(ordered))) - 1))
+        result["p{}".format(point)] = ordered[index]
+    return result
+
+
+def measure(function):
+    """
+    Run function twice: once timed, once under tracemalloc. Returns
+    (elapsed seconds, value returned by the timed run, allocation stats).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    value = function()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    function()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    allocations = sum(stat.count_diff for stat in after.compare_to(before, "filename")
+                      if stat.count_diff > 0)
+    return elapsed, value, {"peak_bytes": peak, "net_allocated_blocks": allocations}
+
+
+def environment():
+    """Describe the environment the benchmarks ran in."""
+    return {
+        "driver_version": __version__,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def save(results, path):
+    """Write results as JSON to path."""
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+def compare(results, baseline_path):
+    """
+    Compare results against a JSON file previously written by save().
+    Returns a list of (name, metric, baseline, current, ratio) tuples for
+    every throughput metric present in both.
+    """
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+
+    rows = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        for metric in ("bytes_per_sec", "writes_per_sec", "packets_per_sec", "lines_per_sec"):
+            if metric in result and metric in old and old[metric]:
+                rows.append((result["name"], metric, old[metric], result[metric],
+                             result[metric] / old[metric]))
+    return rows
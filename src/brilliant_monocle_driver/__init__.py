@@ -2,12 +2,38 @@
 # License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
 
 import asyncio
+import codecs
+import collections
 import datetime
+import functools
 import itertools
 import logging
-from bleak import BleakScanner, BleakClient
-from .batched import batched
+import time
+from .batched import batched_view
+from .batching import CommandBatch
+from .command_channel import (COMMAND_DISPATCHER_COMMAND, COMMAND_EVENT, encode_command,
+                              parse_command_event)
+from .discovery import DiscoveryCache
+from .dispatch import NotificationDispatcher, DROP_NEWEST, DROP_OLDEST
+from .events import EventRouter
+from .fleet import MonocleFleet, FleetResult
+from .exceptions import MonocleException
+from .framebuffer import FrameStreamer
+from . import helpers
+from .metrics import (MetricsRegistry, MonocleMetrics, PrometheusFileExporter,
+                      StatsdExporter, prometheus_text)
 from .line_reader import LineReader
+from .minify import ScriptPreprocessor
+from .mpy import MpyCompiler
+from .scheduler import OutboundScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from .streams import Stream
+from .records import RecordType, RecordParser, RecordRouter, RECORD_EMITTER_COMMAND
+from .raw_repl import frame_command, ExecuteResult, ResponseReader
+from .transfer import (Upload, Download, TransferResult, TRANSFER_RECEIVER_COMMAND,
+                       UPLOAD_BLOCK_SIZE, UPLOAD_BLOCKS_PER_TRANSACTION, DOWNLOAD_BLOCK_SIZE,
+                       DOWNLOAD_SEGMENT_SIZE)
+from .transport import MonocleTransport, BleakTransport
+from .simulator import SimulatedTransport
 
 __version__ = "0.1.3"
 
@@ -17,60 +43,271 @@ touch.callback(touch.A, lambda x: print("[EVENT:touch-A]"))
 touch.callback(touch.B, lambda x: print("[EVENT:touch-B]"))
 """
 
-
-class MonocleException(Exception):
-    pass
-
 class Monocle:
-    # MTU size. Set this to a different value if you find
-    # difficulty connecting to the Monocle consistently.
+    # Largest MTU size used for any Monocle. Each connection uses the
+    # smaller of this and the MTU the link actually negotiated. Set this to a
+    # different value if you find difficulty connecting to the Monocle
+    # consistently, or pass max_mtu_size to limit a single Monocle.
     #
     # 23 is the default, but Monocle sould support 128
     MTU_SIZE = 128
+
+    # Number of unacknowledged packets allowed in flight when writing without
+    # response.
+    WRITE_WINDOW = 8
+
+    # Delay before the second reconnect attempt after the link drops, and the
+    # most the delay is allowed to grow to as it doubles on each failure.
+    RECONNECT_INITIAL_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 30.0
     logger = logging.getLogger(__name__)
 
     def get_logger():
         """Access the logger for Monocles"""
         return Monocle.logger
 
-    def __init__(self, notify_callback=None, address=None):
+    def __init__(self, notify_callback=None, address=None, transport=None,
+                 write_without_response=False, max_mtu_size=None, preprocessor=None,
+                 compiler=None, dispatcher=None, auto_reconnect=False, metrics=None):
         """
         Prepares a Monocle for connection. Specify an optional callback and optional
         address to connect to.
+
+        transport is the MonocleTransport used to reach the device; it defaults
+        to a BleakTransport. Pass a SimulatedTransport to run without hardware.
+
+        If write_without_response is True, send() pipelines packets using
+        write-without-response when the device supports it, keeping up to
+        write_window packets in flight, and falls back to acknowledged writes
+        if that fails.
+
+        max_mtu_size caps the MTU used for this Monocle only; it defaults to
+        Monocle.MTU_SIZE.
+
+        preprocessor, if provided, is a ScriptPreprocessor applied to every
+        string passed to send() (for example to minify or compress it).
+
+        compiler is the MpyCompiler used for compiled helpers; a default one is
+        created when first needed.
+
+        dispatcher, if provided, is a NotificationDispatcher; notifications are
+        then queued by the receive callback and delivered to notify_callback and
+        line listeners from a separate task instead of inside the callback.
+
+        If auto_reconnect is True, the Monocle reconnects to its known address
+        with exponential backoff whenever the link drops, then restores its
+        setup: touch events, the record emitter, installed helper modules and
+        any hooks added with add_restore_hook. Set keepalive_interval (seconds)
+        before connecting to also poll the link, for transports that do not
+        report disconnects promptly.
+
+        metrics, if provided, is a MonocleMetrics that records bytes and packets
+        sent and received, write and notification latency, line lengths and
+        reconnects; export its registry with prometheus_text, a
+        PrometheusFileExporter or a StatsdExporter.
         """
 
-        self.client = None
-        self.out_channel = None
-        self.in_channel = None
+        if transport is None:
+            transport = BleakTransport()
+
+        self.transport = transport
         self.connected = False
+        self.connections = 0
         self.address = address
         self.notify_callback = notify_callback
-        self.line_reader = LineReader('\r\n')
+        self.write_without_response = write_without_response
+        self.max_mtu_size = max_mtu_size
+        self.preprocessor = preprocessor
+        self.compiler = compiler
+        self.dispatcher = dispatcher
+        self.auto_reconnect = auto_reconnect
+        self.metrics = metrics
+        self.reconnect_initial_delay = Monocle.RECONNECT_INITIAL_DELAY
+        self.reconnect_max_delay = Monocle.RECONNECT_MAX_DELAY
+        self.reconnect_max_attempts = None
+        self.keepalive_interval = None
+        self.reconnect_task = None
+        self.keepalive_task = None
+        self.connected_event = None
+        self.disconnecting = False
+        self.restore_hooks = []
+        self.mtu_size = None
+        self.write_window = Monocle.WRITE_WINDOW
+        self.pipelining_failed = False
+        self.scheduler = OutboundScheduler()
+        # A (ResponseReader, future or None) for every raw REPL frame sent and
+        # not yet answered, oldest first; notifications go to the oldest.
+        self.pending_responses = collections.deque()
+        self.helpers = {}
+        self.helper_sources = {}
+        self.transfer_receiver_installed = False
+        self.notify_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.line_reader = LineReader(b'\r\n')
         self.line_listeners = {}
+        self.raw_line_listeners = {}
         self.next_line_listener_id = itertools.count(1,1)
 
+        self.notification_streams = set()
+        self.touch_streams = set()
+        self.streams = set()
+
+        self.events = EventRouter()
+        self.event_line_listener = None
+        self.records = RecordRouter()
+        self.record_parser = None
+        self.record_emitter_installed = False
+
+        self.command_dispatcher = None
+        self.command_event_listener = None
+        self.command_waiters = {}
+        self.next_command_id = itertools.count(1, 1)
+
         self.touch_events_installed = False
         self.a_callback = None
         self.b_callback = None
 
-    def add_line_listener(self, line_listener):
+        # Application callbacks held back while a notification is handled, to be
+        # run by the dispatcher's executor; None when they are called directly.
+        self.deferred_calls = None
+
+    def add_line_listener(self, line_listener, raw=False):
         """
         Adds a callback to fire when a full line is received from the device.
 
+        If raw is True, the callback receives each line as undecoded bytes;
+        otherwise it receives a str.
+
         Returns a token that can be passed to remove_line_listener to remove this callback.
         """
+        return self._add_line_listener(functools.partial(self._call_listener, line_listener), raw)
+
+    def _add_line_listener(self, line_listener, raw):
+        """
+        Adds a line listener that always runs on the event loop, even when the
+        dispatcher has an executor.
+        """
         listener_id = next(self.next_line_listener_id)
-        Monocle.logger.info("Installing line listener id {}".format(listener_id))
+        Monocle.logger.info("Installing line listener id %s", listener_id)
 
-        self.line_listeners[listener_id] = line_listener
+        if raw:
+            self.raw_line_listeners[listener_id] = line_listener
+        else:
+            self.line_listeners[listener_id] = line_listener
         return listener_id
 
     def remove_line_listener(self, token):
         """
         Remove the line listener corresponding to the token
         """
-        Monocle.logger.info("Removing line listener id {}".format(token))
-        del self.line_listeners[token]
+        Monocle.logger.info("Removing line listener id %s", token)
+        if token in self.raw_line_listeners:
+            del self.raw_line_listeners[token]
+        else:
+            del self.line_listeners[token]
+
+    def add_event_listener(self, name, handler):
+        """
+        Adds a callback to fire when the device prints the tag [EVENT:name].
+        The callback receives the rest of the line after the tag as a str.
+
+        Returns a token that can be passed to remove_event_listener to remove this callback.
+        """
+        return self._add_event_listener(name, functools.partial(self._call_listener, handler))
+
+    def _add_event_listener(self, name, handler):
+        """Adds an event listener that always runs on the event loop."""
+        if self.event_line_listener is None:
+            self.event_line_listener = self._add_line_listener(self.events.route, raw=True)
+        return self.events.add(name, handler)
+
+    def remove_event_listener(self, token):
+        """
+        Remove the event listener corresponding to the token
+        """
+        self.events.remove(token)
+
+    def add_record_listener(self, record_type, handler):
+        """
+        Adds a callback to fire when the device emits a binary record of
+        record_type (a RecordType). The callback receives the record's decoded
+        values. Binary record parsing is enabled by the first call.
+
+        Returns a token that can be passed to remove_record_listener to remove this callback.
+        """
+        return self._add_record_listener(
+            record_type, functools.partial(self._call_listener, handler))
+
+    def _add_record_listener(self, record_type, handler):
+        """Adds a record listener that always runs on the event loop."""
+        if self.record_parser is None:
+            self.record_parser = RecordParser(self.records.route)
+        return self.records.add(record_type, handler)
+
+    def remove_record_listener(self, token):
+        """
+        Remove the record listener corresponding to the token
+        """
+        self.records.remove(token)
+
+    async def install_record_emitter(self):
+        """
+        Defines emit_record(type_id, fmt, *values) on the Monocle, which sends a
+        binary record to the host. Records are length-prefixed and typed, and
+        skip text formatting and line parsing entirely.
+        """
+        self.record_emitter_installed = True
+        await self.send(RECORD_EMITTER_COMMAND)
+
+    async def notifications(self, max_size=256, overflow=DROP_OLDEST):
+        """
+        Async generator yielding the bytes of every notification received from
+        the device, buffering up to max_size notifications (see Stream for the
+        overflow policies). Ends when the Monocle disconnects.
+        """
+        stream = Stream(max_size, overflow)
+        self.notification_streams.add(stream)
+        try:
+            async for bytes_in in self._iterate(stream):
+                yield bytes_in
+        finally:
+            self.notification_streams.discard(stream)
+
+    async def lines(self, max_size=256, overflow=DROP_OLDEST, raw=False):
+        """
+        Async generator yielding each full line received from the device (as
+        bytes if raw is True), buffering up to max_size lines. Ends when the
+        Monocle disconnects.
+        """
+        stream = Stream(max_size, overflow)
+        token = self._add_line_listener(stream.push, raw)
+        try:
+            async for line in self._iterate(stream):
+                yield line
+        finally:
+            self.remove_line_listener(token)
+
+    async def touch_events(self, max_size=256, overflow=DROP_OLDEST):
+        """
+        Async generator yielding "A" or "B" for each touch, buffering up to
+        max_size touches. Requires install_touch_events(). Ends when the Monocle
+        disconnects.
+        """
+        stream = Stream(max_size, overflow)
+        self.touch_streams.add(stream)
+        try:
+            async for touch in self._iterate(stream):
+                yield touch
+        finally:
+            self.touch_streams.discard(stream)
+
+    async def _iterate(self, stream):
+        """Iterate stream, closing it when the Monocle disconnects."""
+        self.streams.add(stream)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.streams.discard(stream)
 
     async def connect(self):
         """
@@ -83,32 +320,203 @@ class Monocle:
         """
         address_to_connect = self.address
         if address_to_connect is None:
-            address_to_connect = await self._find_address_of_monocle()
-
-        client, rx_characteristic, tx_characteristic = await self._get_uart(address_to_connect)
+            address_to_connect = await self.transport.find_address()
 
-        await client.start_notify(tx_characteristic, self._on_notify)
+        self.notify_decoder.reset()
+        self.line_reader = LineReader(b'\r\n')
+        if self.record_parser is not None:
+            self.record_parser = RecordParser(self.records.route)
+        self.pipelining_failed = False
+        self.pending_responses.clear()
+        self.helpers = {}
+        self.transfer_receiver_installed = False
+        if self.connected_event is None:
+            self.connected_event = asyncio.Event()
+        if self.dispatcher is not None:
+            if self.metrics is not None:
+                self.dispatcher.latency_observer = self.metrics.notify_latency.observe
+            self.dispatcher.start(self._dispatch_queued)
+        await self.transport.connect(address_to_connect, self._on_notify, self._on_disconnected)
 
-        self.client = client
-        self.out_channel = rx_characteristic
-        self.in_channel = tx_characteristic
         self.address = address_to_connect
-        Monocle.logger.info("Connected {}".format(self.address))
+        self.mtu_size = self._effective_mtu_size()
+        Monocle.logger.info("Connected %s with MTU size %s", self.address, self.mtu_size)
         self.connected = True
+        self.connections += 1
+        self.connected_event.set()
+
+        if self.keepalive_interval is not None and self.keepalive_task is None:
+            self.keepalive_task = asyncio.ensure_future(self._keepalive())
 
     async def disconnect(self):
         """
-        Disconnect from monocle, if connected.
+        Disconnect from monocle, if connected. This also stops any reconnection
+        in progress.
         """
-        if not self.connected:
+        for task in (self.reconnect_task, self.keepalive_task):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.reconnect_task = None
+        self.keepalive_task = None
+
+        if self.connected:
+            self.disconnecting = True
+            try:
+                await self.transport.disconnect()
+            finally:
+                self.disconnecting = False
+            Monocle.logger.info("Disconnected %s", self.address)
+        # Also after the link dropped on its own, in case that cleanup has not
+        # finished yet.
+        await self._end_session()
+        self._mark_disconnected()
+
+    async def _end_session(self):
+        """
+        Deliver the notifications still queued, then end the notifications(),
+        lines() and touch_events() streams.
+        """
+        if self.dispatcher is not None:
+            await self.dispatcher.stop()
+        for stream in list(self.streams):
+            stream.close()
+
+    async def wait_until_connected(self, timeout=None):
+        """
+        Wait until the Monocle is connected, e.g. while it is reconnecting.
+
+        Raises MonocleException if it is not connected within timeout seconds.
+        """
+        if self.connected:
             return
+        if self.connected_event is None:
+            self.connected_event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self.connected_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise MonocleException("Not connected after {} seconds".format(timeout))
 
-        await self.client.disconnect()
-        Monocle.logger.info("Disconnected {}".format(self.address))
-        self.client = None
-        self.out_channel = None
-        self.in_channel = None
+    def add_restore_hook(self, hook):
+        """
+        Adds a coroutine function called with this Monocle after each automatic
+        reconnect, to restore device state beyond what the Monocle tracks itself.
+        """
+        self.restore_hooks.append(hook)
+
+    def _mark_disconnected(self):
         self.connected = False
+        self.mtu_size = None
+        if self.connected_event is not None:
+            self.connected_event.clear()
+
+    def _on_disconnected(self):
+        """Internal handler for the link dropping."""
+        if self.disconnecting or not self.connected:
+            return
+
+        Monocle.logger.warning("Lost connection to %s", self.address)
+        self._mark_disconnected()
+        if self.metrics is not None:
+            self.metrics.disconnects.inc()
+
+        for _, response in self.pending_responses:
+            if response is not None and not response.done():
+                response.set_exception(MonocleException("Monocle disconnected."))
+        self.pending_responses.clear()
+        for waiter in self.command_waiters.values():
+            if not waiter.done():
+                waiter.set_exception(MonocleException("Monocle disconnected."))
+
+        if not self.auto_reconnect:
+            asyncio.ensure_future(self._end_session())
+        elif self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        """
+        Reconnect to the known address with exponential backoff, then restore
+        device state.
+        """
+        delay = self.reconnect_initial_delay
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                await self.transport.disconnect()
+            except Exception:
+                pass
+
+            try:
+                await self.connect()
+            except Exception as e:
+                Monocle.logger.warning("Reconnect attempt %s to %s failed: %s",
+                                       attempts, self.address, e)
+            else:
+                try:
+                    await self._restore_state()
+                except Exception as e:
+                    Monocle.logger.warning("Restoring state on %s failed: %s", self.address, e)
+                if self.connected:
+                    Monocle.logger.info("Reconnected %s after %s attempts", self.address, attempts)
+                    if self.metrics is not None:
+                        self.metrics.reconnects.inc()
+                    return
+
+            if self.reconnect_max_attempts is not None and attempts >= self.reconnect_max_attempts:
+                Monocle.logger.error("Giving up reconnecting to %s", self.address)
+                await self._end_session()
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    async def _restore_state(self):
+        """
+        Replay the setup the device lost when the link dropped. Each step is
+        attempted even if an earlier one fails; failures are logged.
+        """
+        steps = []
+        if self.touch_events_installed:
+            steps.append(("touch events", lambda: self.send(TOUCH_CALLBACK_COMMAND)))
+        if self.record_emitter_installed:
+            steps.append(("record emitter", lambda: self.send(RECORD_EMITTER_COMMAND)))
+        for name, (source, compiled) in list(self.helper_sources.items()):
+            steps.append(("helper " + name, functools.partial(
+                self.install_helper, name, source, compiled=compiled)))
+        for hook in self.restore_hooks:
+            steps.append((repr(hook), functools.partial(hook, self)))
+        if self.command_dispatcher is not None:
+            # Last, as its loop keeps the raw REPL busy.
+            steps.append(("command dispatcher", functools.partial(
+                self.install_command_dispatcher, *self.command_dispatcher)))
+
+        for description, step in steps:
+            try:
+                await step()
+            except Exception as e:
+                Monocle.logger.warning("Restoring %s on %s failed: %s",
+                                       description, self.address, e)
+
+    async def _keepalive(self):
+        """Poll the transport so a silently dropped link is noticed."""
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if self.connected and not self.transport.is_connected:
+                self._on_disconnected()
+
+    def _effective_mtu_size(self):
+        """
+        The MTU size to use for the current connection: the negotiated MTU,
+        capped at max_mtu_size (or Monocle.MTU_SIZE).
+        """
+        ceiling = self.max_mtu_size
+        if ceiling is None:
+            ceiling = Monocle.MTU_SIZE
+
+        negotiated = self.transport.mtu_size
+        if negotiated is None:
+            return ceiling
+        return min(negotiated, ceiling)
 
     async def __aenter__(self):
         await self.connect()
@@ -116,83 +524,398 @@ class Monocle:
     async def __aexit__(self, exc_type, exc, tb):
         await self.disconnect()
 
-    async def _get_uart(self, address):
+    async def send(self, input, priority=PRIORITY_NORMAL):
         """
-        Get UART endpoints for the monocle at address
+        Send a string (or UTF-8 bytes) to the client.
+
+        Each send is one transaction: concurrent sends wait their turn in the
+        Monocle's OutboundScheduler, most urgent priority first.
 
-        Raises MonocleException if no UART endpoints can be found.
+        Raises exception if Monocle not connected.
+        """
+        async with self.scheduler.transaction(priority):
+            await self._send(input)
 
-        Returns the BLE client, rx, and tx endpoints
+    async def _send(self, input, response=None, preprocess=True):
         """
-        client = BleakClient(address)
-        await client.connect()
-        Monocle.logger.info("Finding UART channel for {}...".format(address))
+        Send input; the caller holds the scheduler. The device's answer is read
+        by the returned ResponseReader, after the answers to every frame sent
+        before it; response, if given, is a future completed once it has been.
+        If preprocess is False, the preprocessor is skipped.
+        """
+        if not self.connected:
+            raise MonocleException("Monocle is not connected.")
 
-        uart_service = None
-        tx_characteristic = None
-        rx_characteristic = None
-        for service in client.services:
-            if service.description == "Nordic UART Service":
-                uart_service = service
+        if preprocess and self.preprocessor is not None and isinstance(input, str):
+            input = self.preprocessor.process(input)
 
-        if uart_service is None:
-            raise MonocleException("No UART service found at {}".format(address))
+        # Queued before writing, as the answer can arrive before the last write
+        # returns.
+        reader = ResponseReader(skip_records=self.record_parser is not None,
+                                capture=response is not None)
+        entry = (reader, response)
+        self.pending_responses.append(entry)
+        try:
+            # Ctrl-C to terminate any previously-running code, then
+            # need to wrap input in CTRL-A / CTRL-D to get into raw repl mode and
+            # execute the content.
+            await self._write(frame_command(input))
+        except BaseException:
+            # Without its final Ctrl-D, the frame is never answered.
+            if entry in self.pending_responses:
+                self.pending_responses.remove(entry)
+            raise
+        return reader
+
+    async def _write(self, buffer):
+        """
+        Write buffer to the device in MTU-sized packets; the caller holds the
+        scheduler.
 
-        Monocle.logger.info("Found UART service.")
+        Raises MonocleException if the Monocle is not connected.
+        """
+        if not self.connected:
+            raise MonocleException("Monocle is not connected.")
+        chunks = batched_view(buffer, self.mtu_size - 3)
+        if (self.write_without_response and not self.pipelining_failed
+                and self.transport.supports_write_without_response):
+            chunks = list(chunks)
+            try:
+                await self._write_pipelined(chunks)
+                return
+            except Exception as e:
+                # The whole payload is resent. A raw REPL command starts with
+                # Ctrl-C, which clears any partial input; a partial command
+                # channel line fails its length check and is dropped.
+                Monocle.logger.warning(
+                    "Write without response failed (%s); falling back to acknowledged writes", e)
+                self.pipelining_failed = True
 
-        for characteristic in uart_service.characteristics:
-            if characteristic.description == "Nordic UART TX":
-                tx_characteristic = characteristic
-            if characteristic.description == "Nordic UART RX":
-                rx_characteristic = characteristic
+        # Checked once, so per-packet logging costs nothing when it is disabled.
+        debug = Monocle.logger.isEnabledFor(logging.DEBUG)
+        for index, chunk in enumerate(chunks, 1):
+            if debug:
+                Monocle.logger.debug("Sending packet %s (%s bytes)", index, len(chunk))
+            if self.metrics is None:
+                await self.transport.write(chunk)
+            else:
+                await self._timed_write(chunk, True)
 
-        if tx_characteristic is None:
-            raise MonocleException("Unable to find TX characteristic at {}".format(
-                address))
-        if rx_characteristic is None:
-            raise MonocleExcpetion("Unable to find RX characteristic at {}".format(
-                    address))
+    async def _timed_write(self, chunk, response):
+        """Write chunk, recording it in the metrics."""
+        metrics = self.metrics
+        start = time.perf_counter()
+        await self.transport.write(chunk, response=response)
+        metrics.write_latency.observe(time.perf_counter() - start)
+        metrics.bytes_sent.inc(len(chunk))
+        metrics.chunks_sent.inc()
 
-        return client, rx_characteristic, tx_characteristic
+    async def _write_pipelined(self, chunks):
+        """
+        Write chunks without response, keeping at most write_window writes in flight.
+        Writes are started in order. If one fails, the remaining in-flight writes
+        are cancelled and the error is raised.
+        """
+        in_flight = collections.deque()
+        try:
+            for chunk in chunks:
+                if len(in_flight) >= self.write_window:
+                    await in_flight.popleft()
+                if self.metrics is None:
+                    write = self.transport.write(chunk, response=False)
+                else:
+                    write = self._timed_write(chunk, False)
+                in_flight.append(asyncio.ensure_future(write))
+            while in_flight:
+                await in_flight.popleft()
+        finally:
+            if in_flight:
+                for write in in_flight:
+                    write.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
 
-    async def _find_address_of_monocle(self):
+    def batch(self, flush_interval=None, max_size=None, priority=PRIORITY_NORMAL):
         """
-        Finds the address of one monocle. Raises an exception if zero or more than one are found.
+        Returns a CommandBatch that coalesces the commands added to it into a
+        single send() at priority. Use it as an async context manager to send on
+        exit, and set flush_interval (seconds) to also send automatically shortly
+        after commands are added.
         """
-        Monocle.logger.info("Scanning for devices...")
-        devices = await BleakScanner.discover()
-        monocles = [device for device in devices if device.name == "monocle"]
-        if len(monocles) != 1:
-            raise MonocleException("Expected 1 device, found {}".format(len(monocles)))
-        return monocles[0].address
+        return CommandBatch(self, flush_interval=flush_interval, max_size=max_size,
+                            priority=priority)
 
+    def frame_streamer(self, **options):
+        """
+        Returns a FrameStreamer for pushing images to this Monocle's display;
+        see FrameStreamer for the options.
+        """
+        return FrameStreamer(self, **options)
 
-    async def send(self, input):
+    async def execute(self, input, timeout=10.0, priority=PRIORITY_NORMAL, preprocess=True):
         """
-        Send a string to the client.
+        Run input on the Monocle through the raw REPL and wait for it to finish.
+        Sending the command and waiting for its response form one transaction
+        in the OutboundScheduler, at priority. Answers still outstanding for
+        commands sent earlier (e.g. by send(), which does not wait for them)
+        are skipped, so the result is always that of input.
 
-        Raises exception if Monocle not connected.
+        Set preprocess to False for generated commands that are used once, such
+        as data transfers: they are then neither minified nor cached by the
+        Monocle's preprocessor.
+
+        Returns an ExecuteResult holding the command's stdout and stderr. Raises
+        MonocleException if the Monocle is not connected or no response arrives
+        within timeout seconds (None waits forever).
         """
         if not self.connected:
             raise MonocleException("Monocle is not connected.")
 
-        input = input.replace("\n", "\r\n")
+        async with self.scheduler.transaction(priority):
+            response = asyncio.get_running_loop().create_future()
+            reader = None
+            try:
+                reader = await self._send(input, response, preprocess)
+                await asyncio.wait_for(response, timeout)
+            except asyncio.TimeoutError:
+                if reader is not None:
+                    # The answer may still come; it is then skipped without being kept.
+                    reader.capture = False
+                raise MonocleException("Timed out after {} seconds waiting for a response".format(
+                    timeout))
+            finally:
+                # If _send failed, the response may have been failed too (e.g. by
+                # _on_disconnected); retrieve or cancel it so asyncio does not
+                # report an unretrieved exception.
+                if not response.done():
+                    response.cancel()
+                elif not response.cancelled():
+                    response.exception()
+
+            return reader.result()
+
+    async def install_helper(self, name, source, force=False, compiled=False):
+        """
+        Install source on the Monocle as the importable module name, unless the
+        same version is already there. A hash of the module is stored next to it,
+        so it is only uploaded again when the source changes (or force is True).
+
+        If compiled is True, source is compiled to .mpy bytecode on the host with
+        the Monocle's MpyCompiler and the bytecode is uploaded instead, so the
+        device does not have to parse and compile it.
+
+        Returns True if the module was uploaded.
+
+        Raises MonocleException if the module could not be compiled or written.
+        """
+        helpers.check_module_name(name)
+        if compiled:
+            if self.compiler is None:
+                self.compiler = MpyCompiler()
+            loop = asyncio.get_running_loop()
+            contents = await loop.run_in_executor(None, self.compiler.compile, source, name)
+            digest = helpers.helper_hash("mpy:" + self.compiler.cache_key(source))
+            path, stale_path = "{}.mpy".format(name), "{}.py".format(name)
+        else:
+            contents = source.encode()
+            digest = helpers.helper_hash(source)
+            path, stale_path = "{}.py".format(name), "{}.mpy".format(name)
+
+        if not force:
+            if self.helpers.get(name) == digest:
+                self.helper_sources[name] = (source, compiled)
+                return False
+            result = await self.execute(helpers.query_hash_command(name))
+            if result.stdout.strip() == digest:
+                self.helpers[name] = digest
+                self.helper_sources[name] = (source, compiled)
+                return False
+
+        Monocle.logger.info("Uploading helper module %s as %s", name, path)
+        # MicroPython imports a .py in preference to a .mpy, so remove the other
+        # form first; the hash is written last so a partial upload never matches.
+        self._check(await self.execute(
+            helpers.remove_command(stale_path) + helpers.remove_command(helpers.hash_path(name))))
+        await self._write_device_file(path, contents)
+        await self._write_device_file(helpers.hash_path(name), digest.encode())
+        self._check(await self.execute(helpers.unload_command(name)))
+        self.helpers[name] = digest
+        self.helper_sources[name] = (source, compiled)
+        return True
+
+    async def run_compiled(self, name, source, timeout=10.0):
+        """
+        Compile source to .mpy on the host, install it as module name (reusing
+        the copy already on the device if unchanged) and run it by importing it.
+
+        Returns the ExecuteResult of the import.
+        """
+        await self.install_helper(name, source, compiled=True)
+        return await self.execute(
+            helpers.unload_command(name) + "import {}\n".format(name), timeout=timeout)
+
+    async def call_helper(self, name, function, *args, **kwargs):
+        """
+        Call function in the helper module name installed by install_helper,
+        sending only a short call expression. Arguments must be values whose
+        repr() is valid MicroPython.
+
+        Returns the ExecuteResult of the call.
+        """
+        helpers.check_module_name(name)
+        return await self.execute(helpers.call_command(name, function, args, kwargs))
+
+    async def upload_file(self, source, path, block_size=UPLOAD_BLOCK_SIZE, progress=None,
+                          max_retries=5, reconnect_timeout=60.0, priority=PRIORITY_BULK,
+                          blocks_per_transaction=UPLOAD_BLOCKS_PER_TRANSACTION):
+        """
+        Upload source (a local file path, a binary file object or bytes) to path
+        on the Monocle's filesystem.
+
+        The file is sent in blocks of block_size bytes, each checked against a
+        CRC on the device, into path + ".part", which is renamed to path once
+        the whole file has been verified. After an error or a disconnect the
+        upload resumes from the data already on the device, also across calls;
+        if auto_reconnect is on, it waits up to reconnect_timeout seconds for
+        the link to return. progress, if given, is called with (bytes on device,
+        total bytes) after each block. Blocks are sent blocks_per_transaction at a
+        time, each group a transaction at priority, so more urgent commands run
+        between groups.
+
+        Returns a TransferResult.
 
-        mtu_size = Monocle.MTU_SIZE
-        Monocle.logger.info("MTU size is {}".format(mtu_size))
+        Raises MonocleException if a block fails more than max_retries times in
+        a row or the Monocle disconnects without reconnecting.
+        """
+        return await Upload(self, source, path, block_size=block_size, progress=progress,
+                            max_retries=max_retries, reconnect_timeout=reconnect_timeout,
+                            priority=priority,
+                            blocks_per_transaction=blocks_per_transaction).run()
+
+    async def download_file(self, path, destination, block_size=DOWNLOAD_BLOCK_SIZE,
+                            segment_size=DOWNLOAD_SEGMENT_SIZE, progress=None, max_retries=5,
+                            reconnect_timeout=60.0, timeout=60.0, priority=PRIORITY_BULK):
+        """
+        Download path from the Monocle's filesystem to destination: a local file
+        path, a binary file object, or an async function called with each block
+        of bytes. Blocks are written as they arrive, so the file is never held in
+        memory.
+
+        The file travels as binary records of block_size bytes, segment_size
+        bytes per transaction, each segment checked against a CRC computed on
+        the device; segments are transactions at priority, so more urgent
+        commands run between them. If the link drops and auto_reconnect is on, the download
+        waits up to reconnect_timeout seconds and continues from the last block
+        received. timeout bounds each segment. progress, if given, is called
+        with (bytes received, total bytes) after each block; the total is None
+        until the end of the first segment.
+
+        Returns a TransferResult, whose throughput is in bytes per second.
+
+        Raises MonocleException if the file cannot be read, fails verification,
+        or the download cannot be completed.
+        """
+        return await Download(self, path, destination, block_size=block_size,
+                              segment_size=segment_size, progress=progress,
+                              max_retries=max_retries, reconnect_timeout=reconnect_timeout,
+                              timeout=timeout, priority=priority).run()
+
+    async def install_transfer_receiver(self):
+        """
+        Define the functions file transfers use on the device, if this
+        connection has not already.
+        """
+        if not self.transfer_receiver_installed:
+            self._check(await self.execute(TRANSFER_RECEIVER_COMMAND))
+            self.transfer_receiver_installed = True
+
+    async def _write_device_file(self, path, data):
+        """
+        Write data (bytes) to path on the Monocle's filesystem.
+
+        Raises MonocleException if the device reports an error.
+        """
+        await self.upload_file(data, path)
+
+    async def install_command_dispatcher(self, start_loop=True, tick=None, interval_ms=10):
+        """
+        Defines a command dispatcher on the Monocle, so send_command() can run
+        code without the Ctrl-C that send() and execute() use to take over the
+        raw REPL, which would stop whatever program is running.
+
+        The device gains poll_commands(), which runs any commands waiting on
+        stdin and returns immediately; an application's own loop calls it once
+        per iteration. If start_loop is True, the dispatcher's own loop is
+        started instead: it polls for commands, calling the device function
+        named tick (if any) between polls, or else sleeping interval_ms.
+
+        send() and execute() still interrupt the running program; call this
+        again (or restart the application) afterwards. With auto_reconnect, the
+        dispatcher is reinstalled after a reconnect.
+        """
+        if self.command_event_listener is None:
+            self.command_event_listener = self._add_event_listener(
+                COMMAND_EVENT, self._on_command_event)
+
+        self._check(await self.execute(COMMAND_DISPATCHER_COMMAND))
+        self.command_dispatcher = (start_loop, tick, interval_ms)
+        if start_loop:
+            await self.send("command_loop({}, {})".format(tick or "None", interval_ms))
 
-        # Ctrl-C to terminate any previously-running code, then
-        # need to wrap input in CTRL-A / CTRL-D to get into raw repl mode and
-        # execute the content.
-        input = '\x03\x01' + input + '\x04'
+    async def send_command(self, source, wait=False, timeout=10.0, priority=PRIORITY_NORMAL,
+                           preprocess=True):
+        """
+        Run source on the Monocle through the command dispatcher (see
+        install_command_dispatcher) without interrupting the running program.
+        Commands run in the program's global namespace.
+
+        If wait is True, waits up to timeout seconds for the command to finish.
+        preprocess is as for execute().
+
+        Raises MonocleException if no dispatcher is installed, the Monocle is
+        not connected, or (when waiting) the command raises or does not finish
+        in time.
+        """
+        if self.command_dispatcher is None:
+            raise MonocleException(
+                "No command dispatcher installed; call install_command_dispatcher() first.")
+        if not self.connected:
+            raise MonocleException("Monocle is not connected.")
+
+        if preprocess and self.preprocessor is not None and isinstance(source, str):
+            source = self.preprocessor.process(source)
 
-        buffer = input.encode()
+        command_id = next(self.next_command_id)
+        tag = str(command_id)
+        if wait:
+            self.command_waiters[tag] = asyncio.get_running_loop().create_future()
+        try:
+            async with self.scheduler.transaction(priority):
+                # _write() raises if the link dropped while this waited.
+                await self._write(encode_command(command_id, source))
+            if wait:
+                await asyncio.wait_for(self.command_waiters[tag], timeout)
+        except asyncio.TimeoutError:
+            raise MonocleException("Timed out after {} seconds waiting for command {}".format(
+                timeout, command_id))
+        finally:
+            self.command_waiters.pop(tag, None)
 
-        batch_count = 1
-        for chunk in batched(buffer, mtu_size - 3):
-            Monocle.logger.info("Sending batch {}".format(batch_count))
-            batch_count += 1
-            await self.client.write_gatt_char(self.out_channel, chunk)
+    def _on_command_event(self, payload):
+        """Internal event listener for commands finishing on the device."""
+        tag, error = parse_command_event(payload)
+        waiter = self.command_waiters.get(tag)
+        if waiter is None or waiter.done():
+            return
+        if error is None:
+            waiter.set_result(None)
+        else:
+            waiter.set_exception(MonocleException("Command failed on the Monocle: {}".format(error)))
+
+    def _check(self, result):
+        """Raise MonocleException if result reports an error."""
+        if not result.ok:
+            raise MonocleException("Monocle reported an error: {}".format(result.stderr))
+        return result
 
     async def install_touch_events(self):
         """
@@ -206,7 +929,8 @@ class Monocle:
 
         if not self.touch_events_installed:
             self.touch_events_installed = True
-            self.add_line_listener(self._touch_line_listener)
+            self._add_event_listener("touch-A", lambda payload: self._on_touch("A"))
+            self._add_event_listener("touch-B", lambda payload: self._on_touch("B"))
 
         await self.send(TOUCH_CALLBACK_COMMAND)
 
@@ -224,21 +948,91 @@ class Monocle:
 
     def _on_notify(self, channel, bytes_in):
         """Internal handler for dispatching notifications to the notify_callback."""
-        text_in = bytes_in.decode("utf-8")
-        Monocle.logger.info("Notify: <<{}>>".format(text_in))
-        if self.notify_callback is not None:
-            self.notify_callback(channel, text_in)
+        metrics = self.metrics
+        if metrics is not None:
+            received_at = time.perf_counter()
+            metrics.bytes_received.inc(len(bytes_in))
+            metrics.notifications_received.inc()
 
-        self.line_reader.input(text_in)
+        responses = self.pending_responses
+        data = bytes_in
+        while responses and data:
+            reader, response = responses[0]
+            if not reader.input(data):
+                break
+            responses.popleft()
+            if response is not None and not response.done():
+                response.set_result(None)
+            data = reader.remainder
 
-        for line in self.line_reader.get_lines():
-            for listener in self.line_listeners.values():
-                listener(line)
+        if self.dispatcher is not None and self.dispatcher.running:
+            self.dispatcher.put(channel, bytes_in)
+        else:
+            self._dispatch_notification(channel, bytes_in)
+            if metrics is not None:
+                metrics.notify_latency.observe(time.perf_counter() - received_at)
 
-    def _touch_line_listener(self, line):
-        """Internal line listener to watch for A and B touch events."""
-        if "[EVENT:touch-A]" in line and self.a_callback is not None:
-            self.a_callback()
-        if "[EVENT:touch-B]" in line and self.b_callback is not None:
-            self.b_callback()
+    def _dispatch_queued(self, channel, bytes_in):
+        """
+        Dispatcher handler: deliver one queued notification on the event loop.
+        If the dispatcher has an executor, application callbacks are collected
+        rather than called, and returned for the dispatcher to run there.
+        """
+        if self.dispatcher.executor is None:
+            self._dispatch_notification(channel, bytes_in)
+            return None
+
+        self.deferred_calls = []
+        try:
+            self._dispatch_notification(channel, bytes_in)
+            return self.deferred_calls
+        finally:
+            self.deferred_calls = None
+
+    def _call_listener(self, listener, *args):
+        """Call an application callback, or hold it for the dispatcher's executor."""
+        if self.deferred_calls is None:
+            listener(*args)
+        else:
+            self.deferred_calls.append((listener, args))
+
+    def _dispatch_notification(self, channel, bytes_in):
+        """Deliver one notification to the notify_callback and line listeners."""
+        if self.record_parser is not None:
+            bytes_in = self.record_parser.input(bytes_in)
+            if not bytes_in:
+                return
+
+        for stream in self.notification_streams:
+            stream.push(bytes(bytes_in))
+
+        debug = Monocle.logger.isEnabledFor(logging.DEBUG)
+        if self.notify_callback is not None or debug:
+            # A multibyte character may be split across packets; the incremental
+            # decoder holds partial characters until the rest arrives.
+            text_in = self.notify_decoder.decode(bytes_in)
+            if debug:
+                Monocle.logger.debug("Notify: <<%s>>", text_in)
+            if self.notify_callback is not None:
+                self._call_listener(self.notify_callback, channel, text_in)
+
+        self.line_reader.input(bytes_in)
+
+        line_length = self.metrics.line_length if self.metrics is not None else None
+        for line in self.line_reader.get_raw_lines():
+            if line_length is not None:
+                line_length.observe(len(line))
+            for listener in self.raw_line_listeners.values():
+                listener(line)
+            if self.line_listeners:
+                text_line = line.decode("utf-8", errors="replace")
+                for listener in self.line_listeners.values():
+                    listener(text_line)
 
+    def _on_touch(self, button):
+        """Internal event listener for A and B touch events."""
+        callback = self.a_callback if button == "A" else self.b_callback
+        if callback is not None:
+            self._call_listener(callback)
+        for stream in self.touch_streams:
+            stream.push(button)
@@ -11,3 +11,14 @@ def batched(iterable, length):
     while cursor < len(iterable):
         yield iterable[cursor:cursor + length]
         cursor += length
+
+
+def batched_view(buffer, length):
+    """
+    Zero-copy variant of batched for bytes-like buffers. Yields memoryview slices
+    of length (length) over buffer instead of copying each chunk.
+    """
+
+    view = memoryview(buffer)
+    for cursor in range(0, len(view), length):
+        yield view[cursor:cursor + length]
@@ -0,0 +1,86 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import logging
+from .scheduler import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+
+class CommandBatch:
+    """
+    Collects commands and sends them to a Monocle together as one raw REPL
+    transaction, so a burst of small commands costs one interrupt, one raw REPL
+    entry and one write sequence instead of one each.
+
+    The batch is sent by flush(), on leaving an `async with` block, once it
+    reaches max_size bytes, or (if flush_interval is set) flush_interval seconds
+    after the first command of the batch was added, so that commands issued
+    close together are coalesced automatically.
+
+    Commands are joined with newlines, so each must be complete at top level.
+    The batch is sent at priority (see OutboundScheduler).
+    """
+
+    def __init__(self, monocle, flush_interval=None, max_size=None, priority=PRIORITY_NORMAL):
+        self.monocle = monocle
+        self.priority = priority
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.commands = []
+        self.size = 0
+        self.timer = None
+        self.flush_task = None
+        self.lock = None
+
+    def add(self, command):
+        """Queue command for the next flush."""
+        self.commands.append(command)
+        self.size += len(command) + 1
+
+        if self.max_size is not None and self.size >= self.max_size:
+            self._cancel_timer()
+            self._schedule_flush()
+        elif self.flush_interval is not None and self.timer is None:
+            loop = asyncio.get_running_loop()
+            self.timer = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    async def flush(self):
+        """Send every queued command as one transaction."""
+        self._cancel_timer()
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            if not self.commands:
+                return
+            command = "\n".join(self.commands)
+            self.commands = []
+            self.size = 0
+            await self.monocle.send(command, priority=self.priority)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+        else:
+            self._cancel_timer()
+        if self.flush_task is not None:
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+
+    def _schedule_flush(self):
+        self.timer = None
+        self.flush_task = asyncio.ensure_future(self.flush())
+        self.flush_task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Automatic flush failed: %s", task.exception())
+
+    def _cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,68 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import base64
+
+# Event printed by the device after running each command: the command id,
+# followed by the error if it raised.
+COMMAND_EVENT = "command"
+
+# MicroPython defining the device side of the command channel. poll_commands()
+# runs every complete command line waiting on stdin without blocking, so an
+# application's own loop can call it once per frame; command_loop() is a
+# ready-made loop calling it, plus an optional tick function. Commands are
+# newline-terminated "<id> <length> <base64 source>" lines, so they never contain
+# the raw REPL's control characters and nothing is interrupted to deliver them.
+# A line whose source is not exactly length characters long is what is left of
+# an interrupted write, and is dropped without running or reporting it.
+COMMAND_DISPATCHER_COMMAND = """
+import sys, uselect, ubinascii
+_cmd_poller = uselect.poll()
+_cmd_poller.register(sys.stdin, uselect.POLLIN)
+_cmd_line = []
+def poll_commands():
+    while _cmd_poller.poll(0):
+        c = sys.stdin.read(1)
+        if c != "\\n" and c != "\\r":
+            _cmd_line.append(c)
+            continue
+        line = "".join(_cmd_line)
+        del _cmd_line[:]
+        if not line:
+            continue
+        tag, _, data = line.partition(" ")
+        length, _, data = data.partition(" ")
+        if not length.isdigit() or int(length) != len(data):
+            continue
+        try:
+            exec(ubinascii.a2b_base64(data).decode(), globals())
+            print("[EVENT:command]", tag)
+        except Exception as e:
+            print("[EVENT:command]", tag, repr(e))
+def command_loop(tick=None, interval_ms=10):
+    import time
+    while True:
+        poll_commands()
+        if tick is not None:
+            tick()
+        else:
+            time.sleep_ms(interval_ms)
+"""
+
+
+def encode_command(command_id, source):
+    """
+    The line carrying source (str or bytes) to the device's command dispatcher.
+    It starts with a newline to end any partial line left by an interrupted
+    write; the dispatcher then drops that line, as its length does not match.
+    """
+    if isinstance(source, str):
+        source = source.encode()
+    data = base64.b64encode(source)
+    return b"\n%d %d %s\n" % (command_id, len(data), data)
+
+
+def parse_command_event(payload):
+    """(command id, error or None) from the payload of a command event."""
+    tag, _, error = payload.strip().partition(" ")
+    return tag, (error or None)
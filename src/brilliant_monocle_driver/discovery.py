@@ -0,0 +1,93 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Nordic UART Service, which the Monocle firmware exposes its REPL on.
+NUS_SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
+NUS_RX_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
+NUS_TX_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+
+MONOCLE_NAME = "monocle"
+
+
+def cache_root():
+    """Directory the driver keeps its on-disk caches in."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "brilliant_monocle_driver")
+
+
+def is_monocle(device, advertisement_data=None):
+    """
+    True if a scanned device is a Monocle: it is named monocle. Advertising the
+    UART service alone is not enough, as other devices use it too.
+    """
+    if device.name == MONOCLE_NAME:
+        return True
+    return advertisement_data is not None and advertisement_data.local_name == MONOCLE_NAME
+
+
+class DiscoveryCache:
+    """
+    Persistent record of the Monocles this host has connected to, and the GATT
+    handles of their UART characteristics, so later connections can skip most
+    of the scan and look the characteristics up directly.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cache_root(), "devices.json")
+        self.path = path
+        self.devices = {}
+        self._load()
+
+    def addresses(self):
+        """Known addresses, most recently connected first."""
+        return sorted(self.devices, key=lambda address: self.devices[address].get("last_connected", 0),
+                      reverse=True)
+
+    def handles(self, address):
+        """(rx_handle, tx_handle) recorded for address, or None."""
+        device = self.devices.get(address)
+        if device is None or "rx_handle" not in device or "tx_handle" not in device:
+            return None
+        return device["rx_handle"], device["tx_handle"]
+
+    def remember(self, address, rx_handle, tx_handle):
+        """Record a successful connection to address and its characteristic handles."""
+        self.devices[address] = {
+            "rx_handle": rx_handle,
+            "tx_handle": tx_handle,
+            "last_connected": time.time(),
+        }
+        self._save()
+
+    def forget(self, address):
+        """Drop everything known about address."""
+        if self.devices.pop(address, None) is not None:
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self.devices = json.load(f).get("devices", {})
+        except FileNotFoundError:
+            self.devices = {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable discovery cache %s: %s", self.path, e)
+            self.devices = {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w") as f:
+                json.dump({"devices": self.devices}, f, indent=2)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logger.warning("Unable to save discovery cache %s: %s", self.path, e)
@@ -0,0 +1,119 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Overflow policies: what to do with a notification that arrives while the
+# queue is full.
+DROP_NEWEST = "drop-newest"
+DROP_OLDEST = "drop-oldest"
+
+
+class NotificationDispatcher:
+    """
+    Takes notification handling out of the transport's receive callback. The
+    callback only enqueues each packet into a bounded queue; a dispatcher task
+    then runs the notify callback and line listeners. Packets are always handled
+    one at a time, in order, on the event loop.
+
+    If executor is given (e.g. a concurrent.futures.ThreadPoolExecutor), the
+    handler may return a list of (callback, args) pairs, which are then called
+    in order on the executor before the next packet is handled, so slow
+    synchronous application callbacks do not block the event loop either.
+
+    When the queue is full, overflow decides whether the new packet
+    (DROP_NEWEST) or the oldest queued one (DROP_OLDEST) is discarded;
+    discarded packets are counted in dropped.
+
+    If latency_observer is set, it is called with the seconds each packet spent
+    between put() and the end of its handling.
+    """
+
+    def __init__(self, max_queue_size=1024, overflow=DROP_OLDEST, executor=None):
+        if overflow not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError("Unknown overflow policy {!r}".format(overflow))
+
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.executor = executor
+
+        self.handler = None
+        self.queue = None
+        self.task = None
+        self.latency_observer = None
+
+        self.enqueued = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def running(self):
+        """True while the dispatcher task is accepting packets."""
+        return self.task is not None
+
+    def start(self, handler):
+        """
+        Start dispatching queued packets to handler(channel, data), which is
+        always called on the event loop. Must be called from a running event loop.
+        """
+        if self.running:
+            return
+        self.handler = handler
+        self.queue = asyncio.Queue(self.max_queue_size)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Finish handling the packets already queued, then stop the dispatcher task.
+        """
+        if not self.running:
+            return
+        task = self.task
+        await self.queue.join()
+        self.task = None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def put(self, channel, data):
+        """Queue a packet for dispatch without blocking."""
+        queue = self.queue
+        if queue.full():
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            queue.get_nowait()
+            queue.task_done()
+        queue.put_nowait((channel, data,
+                          time.perf_counter() if self.latency_observer is not None else None))
+        self.enqueued += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self.queue
+        while True:
+            channel, data, queued_at = await queue.get()
+            try:
+                calls = self.handler(channel, data)
+                if calls:
+                    await loop.run_in_executor(self.executor, _run_calls, calls)
+                self.dispatched += 1
+                if queued_at is not None and self.latency_observer is not None:
+                    self.latency_observer(time.perf_counter() - queued_at)
+            except Exception:
+                self.errors += 1
+                logger.exception("Error dispatching notification")
+            finally:
+                queue.task_done()
+
+
+def _run_calls(calls):
+    for callback, args in calls:
+        callback(*args)
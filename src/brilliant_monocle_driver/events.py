@@ -0,0 +1,68 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import itertools
+
+EVENT_TAG_START = b"[EVENT:"
+EVENT_TAG_END = b"]"
+
+
+def parse_events(line):
+    """
+    Generator yielding (name, payload) as bytes for each [EVENT:name] tag in
+    line (bytes). The payload is the stripped text following the tag, up to
+    the next tag or the end of the line.
+    """
+    start = line.find(EVENT_TAG_START)
+    while start != -1:
+        name_start = start + len(EVENT_TAG_START)
+        name_end = line.find(EVENT_TAG_END, name_start)
+        if name_end == -1:
+            return
+        next_start = line.find(EVENT_TAG_START, name_end)
+        payload_end = len(line) if next_start == -1 else next_start
+        yield line[name_start:name_end], line[name_end + 1:payload_end].strip()
+        start = next_start
+
+
+class EventRouter:
+    """
+    Routes [EVENT:name] tags printed by the device to handlers registered by
+    name. Each line is scanned for tags once and handlers are found by a dict
+    lookup, so the cost per line does not grow with the number of event types.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.names = {}
+        self.next_token = itertools.count(1, 1)
+
+    def add(self, name, handler):
+        """
+        Call handler(payload) whenever the event name arrives; payload is the str
+        following the tag on its line. Returns a token for remove().
+        """
+        token = next(self.next_token)
+        key = name.encode()
+        self.handlers.setdefault(key, {})[token] = handler
+        self.names[token] = key
+        return token
+
+    def remove(self, token):
+        """Remove the handler corresponding to token."""
+        key = self.names.pop(token)
+        handlers = self.handlers[key]
+        del handlers[token]
+        if not handlers:
+            del self.handlers[key]
+
+    def route(self, line):
+        """Dispatch the events in line (bytes) to their handlers."""
+        if EVENT_TAG_START not in line:
+            return
+        for name, payload in parse_events(line):
+            handlers = self.handlers.get(name)
+            if handlers:
+                text = payload.decode("utf-8", errors="replace")
+                for handler in list(handlers.values()):
+                    handler(text)
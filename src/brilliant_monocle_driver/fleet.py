@@ -0,0 +1,137 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import logging
+from .exceptions import MonocleException
+from .transport import BleakTransport
+
+logger = logging.getLogger(__name__)
+
+
+class FleetResult(dict):
+    """
+    Per-device outcome of a fleet operation: maps each address to None if the
+    operation succeeded there, or to the exception it raised.
+    """
+
+    @property
+    def succeeded(self):
+        """Addresses where the operation succeeded."""
+        return [address for address, error in self.items() if error is None]
+
+    @property
+    def failed(self):
+        """Dict of address to exception for addresses where the operation failed."""
+        return {address: error for address, error in self.items() if error is not None}
+
+
+class MonocleFleet:
+    """
+    Drives many Monocles at once. Devices are discovered in a single scan,
+    connected with bounded parallelism, and commands can be broadcast to all
+    of them or a subset.
+    """
+
+    def __init__(self, notify_callback=None, transport_factory=None, max_concurrency=8,
+                 **monocle_options):
+        """
+        Prepares a fleet. notify_callback, if provided, is called with
+        (address, channel, text_in) for notifications from any device.
+
+        transport_factory is called with an address (or None, for discovery) and
+        returns a new MonocleTransport; it defaults to creating BleakTransports.
+        max_concurrency bounds how many devices are connected to or sent to at
+        once. Other keyword arguments are passed to each Monocle.
+        """
+        if transport_factory is None:
+            transport_factory = lambda address: BleakTransport()
+
+        self.notify_callback = notify_callback
+        self.transport_factory = transport_factory
+        self.max_concurrency = max_concurrency
+        self.monocle_options = monocle_options
+        self.monocles = {}
+
+    async def discover(self):
+        """
+        Scan once and return the addresses of all Monocles found.
+        """
+        return await self.transport_factory(None).find_addresses()
+
+    async def connect(self, addresses=None):
+        """
+        Connect to the Monocles at addresses, or to every Monocle discovered if
+        addresses is None. Returns a FleetResult; devices that connected are
+        added to self.monocles.
+        """
+        if addresses is None:
+            addresses = await self.discover()
+
+        for address in addresses:
+            if address not in self.monocles:
+                self.monocles[address] = self._make_monocle(address)
+
+        result = await self._run(addresses, lambda monocle: monocle.connect())
+        for address in result.failed:
+            del self.monocles[address]
+        return result
+
+    async def disconnect(self):
+        """
+        Disconnect from every Monocle in the fleet.
+        """
+        result = await self._run(list(self.monocles), lambda monocle: monocle.disconnect())
+        self.monocles = {}
+        return result
+
+    async def send(self, input, addresses=None):
+        """
+        Send input to the Monocles at addresses, or to every connected Monocle
+        if addresses is None. Returns a FleetResult.
+        """
+        if addresses is None:
+            addresses = list(self.monocles)
+        return await self._run(addresses, lambda monocle: monocle.send(input))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    def _make_monocle(self, address):
+        """Create the Monocle for address, routing its notifications to the fleet callback."""
+        # Imported here because the package imports this module.
+        from . import Monocle
+
+        notify_callback = None
+        if self.notify_callback is not None:
+            notify_callback = lambda channel, text_in: self.notify_callback(
+                address, channel, text_in)
+        return Monocle(notify_callback, address=address,
+                       transport=self.transport_factory(address), **self.monocle_options)
+
+    async def _run(self, addresses, operation):
+        """
+        Run operation(monocle) for each address with at most max_concurrency
+        running at once, collecting the outcome per address.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        result = FleetResult()
+
+        async def run_one(address):
+            async with semaphore:
+                try:
+                    monocle = self.monocles.get(address)
+                    if monocle is None:
+                        raise MonocleException("{} is not part of the fleet".format(address))
+                    await operation(monocle)
+                    result[address] = None
+                except Exception as e:
+                    logger.info("Fleet operation failed on %s: %s", address, e)
+                    result[address] = e
+
+        await asyncio.gather(*[run_one(address) for address in addresses])
+        return result
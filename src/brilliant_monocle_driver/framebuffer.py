@@ -0,0 +1,203 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import base64
+from .exceptions import MonocleException
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DISPLAY_WIDTH = 640
+DISPLAY_HEIGHT = 400
+
+# Byte-to-byte tables splitting 8-bit R, G and B channels into the high and
+# low bytes of big-endian RGB565.
+_HIGH_R = bytes(value & 0xF8 for value in range(256))
+_HIGH_G = bytes(value >> 5 for value in range(256))
+_LOW_G = bytes((value << 3) & 0xE0 for value in range(256))
+_LOW_B = bytes(value >> 3 for value in range(256))
+
+# MicroPython defining the device side of frame streaming. Each block arrives
+# as base64 RGB565 and is handed to the sink function, which the application
+# on the device defines to put the pixels on the display.
+RECEIVER_COMMAND = """
+import ubinascii
+def _fb_blit(x, y, w, h, data):
+    {sink}(x, y, w, h, ubinascii.a2b_base64(data))
+"""
+
+
+def to_rgb565(image, width, height):
+    """
+    Convert an RGB raster to big-endian RGB565 bytes. image is either a NumPy
+    array of shape (height, width, 3) or a bytes-like buffer of packed 8-bit
+    RGB triples. Both paths are vectorized; NumPy is optional.
+
+    Raises MonocleException if the image is the wrong size.
+    """
+    if numpy is not None and isinstance(image, numpy.ndarray):
+        if image.shape != (height, width, 3):
+            raise MonocleException("Expected image of shape {}, got {}".format(
+                (height, width, 3), image.shape))
+        pixels = image.astype(numpy.uint16)
+        packed = (((pixels[..., 0] & 0xF8) << 8) | ((pixels[..., 1] & 0xFC) << 3)
+                  | (pixels[..., 2] >> 3))
+        return packed.astype(">u2").tobytes()
+
+    data = bytes(image)
+    count = width * height
+    if len(data) != count * 3:
+        raise MonocleException("Expected {} bytes of RGB data, got {}".format(count * 3, len(data)))
+
+    red, green, blue = data[0::3], data[1::3], data[2::3]
+    high = (int.from_bytes(red.translate(_HIGH_R), "big")
+            | int.from_bytes(green.translate(_HIGH_G), "big")).to_bytes(count, "big")
+    low = (int.from_bytes(green.translate(_LOW_G), "big")
+           | int.from_bytes(blue.translate(_LOW_B), "big")).to_bytes(count, "big")
+
+    frame = bytearray(count * 2)
+    frame[0::2] = high
+    frame[1::2] = low
+    return bytes(frame)
+
+
+def dirty_rects(previous, current, width, height, tile_size=32):
+    """
+    Compare two RGB565 frames tile by tile and return the changed regions as a
+    list of (x, y, w, h) rectangles; adjacent changed tiles in a tile row are
+    merged. If previous is None, the whole frame is returned.
+    """
+    if previous is None:
+        return [(0, 0, width, height)]
+
+    tiles_x = (width + tile_size - 1) // tile_size
+    tiles_y = (height + tile_size - 1) // tile_size
+
+    if numpy is not None:
+        changed = (numpy.frombuffer(previous, dtype=">u2").reshape(height, width)
+                   != numpy.frombuffer(current, dtype=">u2").reshape(height, width))
+        padded = numpy.zeros((tiles_y * tile_size, tiles_x * tile_size), dtype=bool)
+        padded[:height, :width] = changed
+        dirty = padded.reshape(tiles_y, tile_size, tiles_x, tile_size).any(axis=(1, 3)).tolist()
+    else:
+        dirty = [[False] * tiles_x for _ in range(tiles_y)]
+        row_bytes = width * 2
+        tile_bytes = tile_size * 2
+        with memoryview(previous) as old, memoryview(current) as new:
+            for y in range(height):
+                row = y * row_bytes
+                flags = dirty[y // tile_size]
+                if old[row:row + row_bytes] == new[row:row + row_bytes]:
+                    continue
+                for tile in range(tiles_x):
+                    start = row + tile * tile_bytes
+                    end = min(start + tile_bytes, row + row_bytes)
+                    if not flags[tile] and old[start:end] != new[start:end]:
+                        flags[tile] = True
+
+    rects = []
+    for tile_y, flags in enumerate(dirty):
+        tile = 0
+        while tile < tiles_x:
+            if not flags[tile]:
+                tile += 1
+                continue
+            run_start = tile
+            while tile < tiles_x and flags[tile]:
+                tile += 1
+            x = run_start * tile_size
+            y = tile_y * tile_size
+            rects.append((x, y, min(tile * tile_size, width) - x, min(tile_size, height - y)))
+    return rects
+
+
+def extract_rect(frame, width, x, y, w, h):
+    """The RGB565 bytes of one rectangle of frame, row by row."""
+    with memoryview(frame) as view:
+        return b"".join(view[((row * width) + x) * 2:((row * width) + x + w) * 2]
+                        for row in range(y, y + h))
+
+
+class FrameStreamer:
+    """
+    Streams RGB frames to a Monocle. Each frame is converted to RGB565, diffed
+    against the previous one, and only the changed rectangles are sent, in
+    blocks of at most max_block_bytes pixel bytes, to the device-side receiver
+    installed by install().
+
+    The receiver passes each block to sink(x, y, w, h, rgb565_bytes), a function
+    the device application defines to draw it; present, if given, names a device
+    function called with no arguments after each frame.
+
+    Blocks are sent several at a time, in commands of up to
+    max_transaction_bytes characters, with the call to present appended to the
+    last one. If the Monocle's command dispatcher is installed (see
+    Monocle.install_command_dispatcher), they go through it, so the program
+    running on the device is not interrupted; otherwise through the raw REPL.
+    """
+
+    def __init__(self, monocle, width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT, tile_size=32,
+                 max_block_bytes=1024, max_transaction_bytes=8192, sink="fb_sink",
+                 present=None):
+        self.monocle = monocle
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_block_bytes = max_block_bytes
+        self.max_transaction_bytes = max_transaction_bytes
+        self.sink = sink
+        self.present = present
+        self.previous = None
+
+    async def install(self):
+        """Define the receiver on the device."""
+        self.monocle._check(await self.monocle.execute(RECEIVER_COMMAND.format(sink=self.sink)))
+        self.reset()
+
+    def reset(self):
+        """Forget the previous frame, so the next push sends the whole frame."""
+        self.previous = None
+
+    async def push(self, image):
+        """
+        Send image (see to_rgb565), transmitting only what changed since the last
+        push. Returns the list of rectangles sent.
+
+        Raises MonocleException if the device reports an error.
+        """
+        frame = to_rgb565(image, self.width, self.height)
+        rects = dirty_rects(self.previous, frame, self.width, self.height, self.tile_size)
+
+        commands = []
+        size = 0
+        for x, y, w, h in rects:
+            rows_per_block = max(1, self.max_block_bytes // (w * 2))
+            for block_y in range(y, y + h, rows_per_block):
+                block_h = min(rows_per_block, y + h - block_y)
+                data = base64.b64encode(extract_rect(frame, self.width, x, block_y, w, block_h))
+                command = "_fb_blit({},{},{},{},{!r})".format(
+                    x, block_y, w, block_h, data.decode())
+                if commands and size + len(command) > self.max_transaction_bytes:
+                    await self._run(commands)
+                    commands = []
+                    size = 0
+                commands.append(command)
+                size += len(command) + 1
+
+        if self.present is not None and rects:
+            commands.append("{}()".format(self.present))
+        if commands:
+            await self._run(commands)
+
+        self.previous = frame
+        return rects
+
+    async def _run(self, commands):
+        """Run commands on the device as one transaction."""
+        source = "\n".join(commands)
+        if self.monocle.command_dispatcher is not None:
+            await self.monocle.send_command(source, wait=True, preprocess=False)
+        else:
+            self.monocle._check(await self.monocle.execute(source, preprocess=False))
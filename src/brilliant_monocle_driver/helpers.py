@@ -0,0 +1,47 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import hashlib
+from .exceptions import MonocleException
+
+
+def helper_hash(source):
+    """Short content hash identifying one version of a helper module's source."""
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def check_module_name(name):
+    """Raises MonocleException if name cannot be imported as a module."""
+    if not name.isidentifier():
+        raise MonocleException("Invalid helper module name {!r}".format(name))
+
+
+def hash_path(name):
+    """Path of the file recording the hash of the helper module installed as name."""
+    return "{}.hash".format(name)
+
+
+def query_hash_command(name):
+    """
+    Command printing the hash of the helper module installed on the device, if
+    any, without importing (and so running) the module.
+    """
+    return "try:\n print(open({!r}).read())\nexcept OSError:\n pass\n".format(hash_path(name))
+
+
+def remove_command(path):
+    """Command deleting path on the device if it exists."""
+    return "import os\ntry:\n os.remove({!r})\nexcept OSError:\n pass\n".format(path)
+
+
+def unload_command(name):
+    """Command forgetting any imported copy of a module so it is re-read on next import."""
+    return "import sys\nif {0!r} in sys.modules:\n del sys.modules[{0!r}]\n".format(name)
+
+
+def call_command(name, function, args, kwargs):
+    """Short command calling function in the helper module name."""
+    arguments = [repr(arg) for arg in args]
+    arguments += ["{}={!r}".format(key, value) for key, value in kwargs.items()]
+    return "import {0}\n{0}.{1}({2})".format(name, function, ",".join(arguments))
+
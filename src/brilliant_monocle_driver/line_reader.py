@@ -4,34 +4,72 @@
 class LineReader:
     """
     Reads a stream of text broken into arbitrary chunks and yields each line of the stream.
+    The stream may be fed as str or as bytes; bytes are framed without being decoded.
+
+    Incoming data is appended to a single growable byte buffer. Only the newly-arrived
+    bytes are scanned for the separator, and completed lines are cut from the front of
+    the buffer, so a long line arriving in many small chunks costs linear time.
     """
 
     def __init__(self, sep="\n"):
         """
         Constructor. Sep is the separator sequence for lines.
         """
-        self.current_line = ""
-        self.lines = []
+        if isinstance(sep, str):
+            sep = sep.encode()
+
         self.sep = sep
+        self.buffer = bytearray()
+        self.scanned = 0
+        self.lines = []
+
+    @property
+    def current_line(self):
+        """The incomplete line waiting for a separator."""
+        return self.buffer.decode("utf-8", errors="replace")
 
     def input(self, newtext):
         """
-        Insert new text into the LineReader.
+        Insert new text (str or bytes) into the LineReader.
         """
-        newlines = newtext.split(self.sep)
+        if isinstance(newtext, str):
+            newtext = newtext.encode()
 
-        newlines[0] = self.current_line + newlines[0]
-        new_current_line = newlines[-1]
-        new_emittable_lines = newlines[0:-1]
+        buffer = self.buffer
+        buffer += newtext
 
-        self.current_line = new_current_line
-        self.lines += new_emittable_lines
+        sep = self.sep
+        sep_length = len(sep)
+        # A separator may straddle the old and new data, so back up far enough to
+        # catch it.
+        start = 0
+        index = buffer.find(sep, max(0, self.scanned - sep_length + 1))
+        if index != -1:
+            lines = self.lines
+            with memoryview(buffer) as view:
+                while index != -1:
+                    lines.append(view[start:index].tobytes())
+                    start = index + sep_length
+                    index = buffer.find(sep, start)
+
+        if start:
+            # Deleting from the front of a bytearray only moves its start pointer.
+            del buffer[:start]
+        self.scanned = len(buffer)
 
     def get_lines(self):
         """
         Get available lines as an iterable. Note that there may be no available lines
         at this time.
         """
+        return [line.decode("utf-8", errors="replace") for line in self.get_raw_lines()]
+
+    def get_raw_lines(self):
+        """
+        Get available lines as an iterable of undecoded bytes, without the separator.
+        A separator can never fall inside a multibyte UTF-8 character, so each line
+        can be decoded on its own.
+        """
         emitting_lines = self.lines
         self.lines = []
         return emitting_lines
@@ -0,0 +1,219 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import bisect
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets used for latency histograms.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Upper bounds, in bytes, of the buckets used for line length histograms.
+LENGTH_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+class Counter:
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """
+    Counts observations into buckets with the given upper bounds, and keeps
+    their total count and sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, plus a final one for values above every bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """(upper bound, observations at or below it) pairs, ending with infinity."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry:
+    """
+    A named collection of counters and histograms. labels are constant labels
+    attached to every metric when exported, e.g. {"device": address}.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.metrics = {}
+
+    def counter(self, name, help=""):
+        """Return the counter called name, creating it if needed."""
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=LATENCY_BUCKETS):
+        """Return the histogram called name, creating it if needed."""
+        return self._get(Histogram, name, help, buckets)
+
+    def _get(self, metric_class, name, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(name, *args)
+        elif not isinstance(metric, metric_class):
+            raise ValueError("Metric {} is already a {}".format(name, metric.kind))
+        return metric
+
+    async def export_every(self, exporter, interval):
+        """
+        Call exporter.export(self) every interval seconds until cancelled; run
+        it as a task.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning("Exporting metrics failed: %s", e)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in sorted(labels.items())) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def prometheus_text(registry):
+    """Render registry in the Prometheus text exposition format."""
+    lines = []
+    labels = _format_labels(registry.labels)
+    for name, metric in sorted(registry.metrics.items()):
+        if metric.help:
+            lines.append("# HELP {} {}".format(name, metric.help))
+        lines.append("# TYPE {} {}".format(name, metric.kind))
+        if metric.kind == "counter":
+            lines.append("{}{} {}".format(name, labels, metric.value))
+            continue
+        for bound, count in metric.cumulative_counts():
+            bucket_labels = dict(registry.labels, le=_format_bound(bound))
+            lines.append("{}_bucket{} {}".format(name, _format_labels(bucket_labels), count))
+        lines.append("{}_sum{} {}".format(name, labels, metric.sum))
+        lines.append("{}_count{} {}".format(name, labels, metric.count))
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusFileExporter:
+    """
+    Writes the registry in Prometheus text format to path on each export, e.g.
+    for the node exporter's textfile collector. The file is replaced atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, registry):
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            f.write(prometheus_text(registry))
+        os.replace(temporary_path, self.path)
+
+
+class StatsdExporter:
+    """
+    Sends metrics to a StatsD daemon over UDP on each export: counters as the
+    change since the previous export, and each histogram as the count
+    name.count plus the gauge name.sum.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="monocle."):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sent = {}
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def packets(self, registry):
+        """The StatsD lines for everything that changed since the last call."""
+        lines = []
+        for name, metric in sorted(registry.metrics.items()):
+            if metric.kind == "counter":
+                key, value = name, metric.value
+            else:
+                key, value = name + ".count", metric.count
+            delta = value - self.sent.get(key, 0)
+            if not delta:
+                continue
+            lines.append("{}{}:{}|c".format(self.prefix, key, delta))
+            self.sent[key] = value
+            if metric.kind == "histogram":
+                lines.append("{}{}.sum:{}|g".format(self.prefix, name, metric.sum))
+        return lines
+
+    def export(self, registry):
+        for line in self.packets(registry):
+            self.socket.sendto(line.encode(), self.address)
+
+    def close(self):
+        self.socket.close()
+
+
+class MonocleMetrics:
+    """
+    The metrics a Monocle records when passed as its metrics option. They are
+    registered in registry (a new MetricsRegistry if not given).
+    """
+
+    def __init__(self, registry=None):
+        if registry is None:
+            registry = MetricsRegistry()
+        self.registry = registry
+
+        self.bytes_sent = registry.counter(
+            "monocle_bytes_sent_total", "Bytes written to the device")
+        self.chunks_sent = registry.counter(
+            "monocle_chunks_sent_total", "Packets written to the device")
+        self.write_latency = registry.histogram(
+            "monocle_write_latency_seconds", "Time for one packet write to complete")
+        self.bytes_received = registry.counter(
+            "monocle_bytes_received_total", "Bytes notified by the device")
+        self.notifications_received = registry.counter(
+            "monocle_notifications_received_total", "Notifications received from the device")
+        self.notify_latency = registry.histogram(
+            "monocle_notify_latency_seconds",
+            "Time from receiving a notification to delivering it to listeners")
+        self.line_length = registry.histogram(
+            "monocle_line_length_bytes", "Length of lines received from the device",
+            LENGTH_BUCKETS)
+        self.disconnects = registry.counter(
+            "monocle_disconnects_total", "Unexpected losses of the link")
+        self.reconnects = registry.counter(
+            "monocle_reconnects_total", "Successful automatic reconnects")
@@ -0,0 +1,105 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import ast
+import base64
+import collections
+import hashlib
+import zlib
+
+# Window size (as a power of two) used when compressing. A small window keeps the
+# device's decompression buffer small.
+COMPRESSION_WBITS = 10
+
+DECOMPRESS_STUB = """try:
+ import zlib
+ _d=zlib.decompress
+except ImportError:
+ import deflate,io
+ _d=lambda b:deflate.DeflateIO(io.BytesIO(b),deflate.ZLIB).read()
+import ubinascii
+exec(_d(ubinascii.a2b_base64({!r})).decode())
+"""
+
+
+def _strip_docstrings(tree):
+    """Remove docstrings from the module, classes and functions in tree."""
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef,
+                                 ast.AsyncFunctionDef)):
+            continue
+        body = node.body
+        if (body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)):
+            del body[0]
+            if not body and not isinstance(node, ast.Module):
+                body.append(ast.Pass())
+
+
+def minify(source):
+    """
+    Shrink MicroPython source: drop comments, docstrings and blank lines, and
+    indent with one space per level. Source that does not parse is returned
+    unchanged.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return source
+
+    _strip_docstrings(tree)
+
+    # With docstrings gone, unparsed code has no multi-line strings, so every
+    # line's leading spaces are indentation in steps of four.
+    lines = []
+    for line in ast.unparse(tree).split("\n"):
+        stripped = line.lstrip(" ")
+        if stripped:
+            lines.append(" " * ((len(line) - len(stripped)) // 4) + stripped)
+    return "\n".join(lines)
+
+
+def compress(source):
+    """
+    Wrap source in a small script that decompresses and runs it on the device.
+    Returns source unchanged if that would not make it smaller.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, COMPRESSION_WBITS)
+    data = compressor.compress(source.encode()) + compressor.flush()
+    wrapped = DECOMPRESS_STUB.format(base64.b64encode(data).decode())
+    if len(wrapped) >= len(source.encode()):
+        return source
+    return wrapped
+
+
+class ScriptPreprocessor:
+    """
+    Pipeline stage applied to scripts before Monocle.send(): minifies and
+    optionally compresses them. Results are cached by a hash of the script,
+    so sending the same script again costs only a hash.
+    """
+
+    def __init__(self, minify=True, compress=False, cache_size=256):
+        self.minify = minify
+        self.compress = compress
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+
+    def process(self, script):
+        """Return the script to send in place of script."""
+        key = hashlib.sha256(script.encode()).digest()
+        processed = self.cache.get(key)
+        if processed is not None:
+            self.cache.move_to_end(key)
+            return processed
+
+        processed = script
+        if self.minify:
+            processed = minify(processed)
+        if self.compress:
+            processed = compress(processed)
+
+        self.cache[key] = processed
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return processed
@@ -0,0 +1,104 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from .discovery import cache_root
+from .exceptions import MonocleException
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir():
+    """Directory compiled .mpy files are cached in by default."""
+    return os.path.join(cache_root(), "mpy")
+
+
+class MpyCompiler:
+    """
+    Compiles MicroPython source to .mpy bytecode with a locally installed
+    mpy-cross, caching the output on disk by a hash of the source, the
+    compiler's version and its arguments.
+
+    The .mpy format must match the firmware's MicroPython version; pass args
+    (e.g. ["-march=armv7emsp"]) to target the device more specifically.
+    """
+
+    def __init__(self, executable=None, args=(), cache_dir=None):
+        """
+        executable is the mpy-cross command to run; by default the mpy-cross on
+        PATH is used, or else the mpy_cross Python package if it is installed.
+        """
+        if executable is not None:
+            command = [executable]
+        elif shutil.which("mpy-cross") is not None:
+            command = [shutil.which("mpy-cross")]
+        elif importlib.util.find_spec("mpy_cross") is not None:
+            command = [sys.executable, "-m", "mpy_cross"]
+        else:
+            command = None
+
+        self.command = command
+        self.args = list(args)
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self._version = None
+
+    def available(self):
+        """True if a cross-compiler was found."""
+        return self.command is not None
+
+    def version(self):
+        """The version string reported by the cross-compiler."""
+        if self._version is None:
+            self._version = self._run(["--version"]).stdout.strip()
+        return self._version
+
+    def cache_key(self, source):
+        """Key identifying the compiled output for source."""
+        identity = "\0".join([self.version()] + self.args + [source])
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def compile(self, source, name="main"):
+        """
+        Compile source (the module name) and return the .mpy bytes, from the
+        cache if this source was compiled before.
+
+        Raises MonocleException if no compiler is available or compilation fails.
+        """
+        cached_path = os.path.join(self.cache_dir, self.cache_key(source) + ".mpy")
+        if os.path.exists(cached_path):
+            with open(cached_path, "rb") as f:
+                return f.read()
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            source_path = os.path.join(work_dir, name + ".py")
+            output_path = os.path.join(work_dir, name + ".mpy")
+            with open(source_path, "w") as f:
+                f.write(source)
+            self._run(self.args + ["-o", output_path, source_path])
+            with open(output_path, "rb") as f:
+                compiled = f.read()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary_path = cached_path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(compiled)
+        os.replace(temporary_path, cached_path)
+        logger.info("Compiled %s to %s bytes of bytecode", name, len(compiled))
+        return compiled
+
+    def _run(self, args):
+        if self.command is None:
+            raise MonocleException("No MicroPython cross-compiler (mpy-cross) found.")
+        try:
+            return subprocess.run(self.command + args, capture_output=True, text=True,
+                                  check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise MonocleException("mpy-cross failed: {}".format(
+                getattr(e, "stderr", None) or e))
@@ -0,0 +1,164 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+from .records import RecordParser
+
+# Ctrl-C to terminate any previously-running code, then Ctrl-A to enter raw
+# REPL mode. Ctrl-D executes the received content.
+RAW_REPL_START = b"\x03\x01"
+RAW_REPL_END = b"\x04"
+
+# Printed by the device every time it enters raw REPL mode.
+RAW_REPL_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+
+
+def frame_command(command):
+    """
+    Frame command (str or bytes) as a raw REPL transaction, rewriting each
+    newline as CRLF. The frame is built in a single preallocated bytearray.
+    """
+    if isinstance(command, str):
+        command = command.encode()
+
+    frame = bytearray(len(RAW_REPL_START) + len(command) + command.count(b"\n")
+                      + len(RAW_REPL_END))
+    frame[0:len(RAW_REPL_START)] = RAW_REPL_START
+    out = len(RAW_REPL_START)
+
+    with memoryview(command) as source:
+        start = 0
+        index = command.find(b"\n")
+        while index != -1:
+            frame[out:out + index - start] = source[start:index]
+            out += index - start
+            frame[out:out + 2] = b"\r\n"
+            out += 2
+            start = index + 1
+            index = command.find(b"\n", start)
+        frame[out:out + len(command) - start] = source[start:]
+        out += len(command) - start
+
+    frame[out:] = RAW_REPL_END
+    return frame
+
+
+class ExecuteResult:
+    """
+    Output of a command run in the raw REPL. stderr is empty if the command
+    completed without raising.
+    """
+
+    def __init__(self, stdout, stderr):
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def ok(self):
+        """True if the command did not report an error."""
+        return not self.stderr
+
+    def __repr__(self):
+        return "ExecuteResult(stdout={!r}, stderr={!r})".format(self.stdout, self.stderr)
+
+
+class ResponseReader:
+    """
+    Watches a stream of bytes from the device for the raw REPL's response to one
+    command: the banner printed on entering raw mode, then "OK", stdout, Ctrl-D,
+    stderr, Ctrl-D. Any bytes after the response are kept in remainder, as they
+    belong to whatever the device sends next.
+
+    If skip_records is True, binary records (see RecordParser) are removed from
+    the stream first, so their payloads are neither buffered nor mistaken for
+    the end of the response. If capture is False, only the end of the response
+    is looked for and its output is not kept.
+    """
+
+    WAITING_FOR_BANNER = 0
+    WAITING_FOR_OK = 1
+    READING_STDOUT = 2
+    READING_STDERR = 3
+    DONE = 4
+
+    def __init__(self, skip_records=False, capture=True):
+        self.buffer = bytearray()
+        self.record_parser = RecordParser(_ignore_record) if skip_records else None
+        self.capture = capture
+        self.state = ResponseReader.WAITING_FOR_BANNER
+        self.stdout = None
+        self.stderr = None
+        self.remainder = b""
+
+    def input(self, data):
+        """
+        Insert new bytes from the device. Returns True once the response is complete.
+        """
+        if self.state == ResponseReader.DONE:
+            return True
+
+        if self.record_parser is not None:
+            data = self.record_parser.input(data)
+
+        buffer = self.buffer
+        buffer += data
+
+        if self.state == ResponseReader.WAITING_FOR_BANNER:
+            if not self._consume_through(RAW_REPL_BANNER):
+                return False
+            self.state = ResponseReader.WAITING_FOR_OK
+
+        if self.state == ResponseReader.WAITING_FOR_OK:
+            if not self._consume_through(b"OK"):
+                return False
+            self.state = ResponseReader.READING_STDOUT
+
+        if self.state == ResponseReader.READING_STDOUT:
+            self.stdout = self._read_output()
+            if self.stdout is None:
+                return False
+            self.state = ResponseReader.READING_STDERR
+
+        self.stderr = self._read_output()
+        if self.stderr is None:
+            return False
+        self.remainder = bytes(buffer)
+        del buffer[:]
+        self.state = ResponseReader.DONE
+        return True
+
+    def result(self):
+        """The ExecuteResult for a complete response."""
+        return ExecuteResult(self.stdout.decode("utf-8", errors="replace"),
+                             self.stderr.decode("utf-8", errors="replace"))
+
+    def _read_output(self):
+        """
+        Cut the output up to the next Ctrl-D from the buffer and return it (empty
+        if not capturing), or None if the Ctrl-D has not arrived yet.
+        """
+        buffer = self.buffer
+        index = buffer.find(RAW_REPL_END)
+        if index == -1:
+            if not self.capture:
+                del buffer[:]
+            return None
+        output = bytes(buffer[:index]) if self.capture else b""
+        del buffer[:index + 1]
+        return output
+
+    def _consume_through(self, marker):
+        """
+        Drop everything up to and including marker from the buffer. If marker is not
+        present, keep only the tail that could be the start of it.
+        """
+        buffer = self.buffer
+        index = buffer.find(marker)
+        if index == -1:
+            del buffer[:max(0, len(buffer) - len(marker) + 1)]
+            return False
+        del buffer[:index + len(marker)]
+        return True
+
+
+def _ignore_record(type_id, payload):
+    pass
@@ -0,0 +1,191 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import itertools
+import struct
+from .exceptions import MonocleException
+
+# Binary records share the UART with printed text. Each record starts with a
+# byte that never occurs in UTF-8 text, followed by a type byte, the payload
+# length (little-endian uint16) and a check byte over the header (see
+# header_check), then the payload and a one-byte sum of the payload. A record
+# whose header or sum does not check out, e.g. because a packet was lost, is
+# discarded and the stream rescanned from just after its marker.
+RECORD_MARKER = 0xFE
+RECORD_HEADER = struct.Struct("<BBHB")
+RECORD_TRAILER_SIZE = 1
+
+# Longest payload accepted; a longer length means a corrupt header.
+MAX_RECORD_PAYLOAD = 4096
+
+# MicroPython defining emit_record(type_id, fmt, *values) on the device. It writes
+# to the stdout buffer directly so the payload is not newline-translated.
+RECORD_EMITTER_COMMAND = """
+import struct, sys
+_record_out = getattr(sys.stdout, "buffer", sys.stdout)
+def emit_record(type_id, fmt, *values):
+    payload = struct.pack(fmt, *values)
+    n = len(payload)
+    _record_out.write(struct.pack("<BBHB", 0xFE, type_id, n, ~(type_id + (n & 0xFF) + (n >> 8)) & 0xFF)
+                      + payload + bytes((sum(payload) & 0xFF,)))
+"""
+
+
+def header_check(type_id, length):
+    """The check byte of a record header."""
+    return ~(type_id + (length & 0xFF) + (length >> 8)) & 0xFF
+
+
+def pack_record(type_id, payload):
+    """A complete record carrying payload (bytes), as the device would send it."""
+    length = len(payload)
+    return (RECORD_HEADER.pack(RECORD_MARKER, type_id, length, header_check(type_id, length))
+            + payload + bytes((sum(payload) & 0xFF,)))
+
+
+class RecordType:
+    """
+    A kind of binary record: a type id (0-255), a name, and the struct format
+    of its payload. With fmt None, the payload is delivered as bytes.
+
+    For example, RecordType(1, "imu", "<hhh") pairs with
+    emit_record(1, "<hhh", x, y, z) on the device.
+    """
+
+    def __init__(self, type_id, name, fmt=None):
+        if not 0 <= type_id <= 255:
+            raise MonocleException("Record type id must be 0-255, got {}".format(type_id))
+        self.type_id = type_id
+        self.name = name
+        self.fmt = fmt
+        self.struct = struct.Struct(fmt) if fmt is not None else None
+
+    def unpack(self, payload):
+        """Decode payload into a tuple of values (or bytes, with no format)."""
+        if self.struct is None:
+            return payload
+        return self.struct.unpack(payload)
+
+    def __repr__(self):
+        return "RecordType({}, {!r}, {!r})".format(self.type_id, self.name, self.fmt)
+
+
+class RecordParser:
+    """
+    Separates binary records from the text around them in a stream of
+    notification bytes. Records may be split across any number of packets.
+    on_record(type_id, payload) is called for each complete record. Records
+    failing validation are counted in invalid, and the bytes after their
+    marker are parsed again.
+    """
+
+    def __init__(self, on_record):
+        self.on_record = on_record
+        self.pending = bytearray()
+        self.invalid = 0
+
+    def input(self, data):
+        """
+        Insert new bytes. Returns the bytes that are not part of any record.
+        """
+        pending = self.pending
+        if not pending and RECORD_MARKER not in data:
+            return data
+
+        text = bytearray()
+        header_size = RECORD_HEADER.size
+        position = 0
+        end = len(data)
+        while position < end:
+            if not pending:
+                index = data.find(RECORD_MARKER, position)
+                if index == -1:
+                    text += data[position:]
+                    break
+                text += data[position:index]
+                position = index
+
+            if len(pending) < header_size:
+                take = min(header_size - len(pending), end - position)
+                pending += data[position:position + take]
+                position += take
+                if len(pending) < header_size:
+                    break
+
+            _, type_id, length, check = RECORD_HEADER.unpack_from(pending)
+            if length > MAX_RECORD_PAYLOAD or check != header_check(type_id, length):
+                data, position, end = self._rescan(data, position)
+                continue
+
+            total = header_size + length + RECORD_TRAILER_SIZE
+            take = min(total - len(pending), end - position)
+            pending += data[position:position + take]
+            position += take
+            if len(pending) < total:
+                break
+
+            payload = bytes(pending[header_size:-RECORD_TRAILER_SIZE])
+            if sum(payload) & 0xFF != pending[-1]:
+                data, position, end = self._rescan(data, position)
+                continue
+            del pending[:]
+            self.on_record(type_id, payload)
+        return text
+
+    def _rescan(self, data, position):
+        """
+        Discard the pending record's marker and queue everything after it to be
+        parsed again. Returns the new (data, position, end).
+        """
+        self.invalid += 1
+        data = bytes(self.pending[1:]) + data[position:]
+        del self.pending[:]
+        return data, 0, len(data)
+
+
+class RecordRouter:
+    """
+    Decodes records by type and delivers them to the handlers registered for
+    that type. Records of unregistered types are counted and discarded.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.handlers = {}
+        self.type_ids = {}
+        self.next_token = itertools.count(1, 1)
+        self.unknown = 0
+
+    def add(self, record_type, handler):
+        """
+        Call handler(values) for every record of record_type. Returns a token
+        for remove().
+        """
+        existing = self.types.get(record_type.type_id)
+        if existing is not None and existing is not record_type:
+            raise MonocleException("Record type id {} is already used by {}".format(
+                record_type.type_id, existing))
+        token = next(self.next_token)
+        self.types[record_type.type_id] = record_type
+        self.handlers.setdefault(record_type.type_id, {})[token] = handler
+        self.type_ids[token] = record_type.type_id
+        return token
+
+    def remove(self, token):
+        """Remove the handler corresponding to token."""
+        type_id = self.type_ids.pop(token)
+        handlers = self.handlers[type_id]
+        del handlers[token]
+        if not handlers:
+            del self.handlers[type_id]
+            del self.types[type_id]
+
+    def route(self, type_id, payload):
+        """Decode and dispatch one record."""
+        handlers = self.handlers.get(type_id)
+        if not handlers:
+            self.unknown += 1
+            return
+        values = self.types[type_id].unpack(payload)
+        for handler in list(handlers.values()):
+            handler(values)
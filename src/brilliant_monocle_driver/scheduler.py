@@ -0,0 +1,64 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+
+# Priorities for outbound transactions; lower values go first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+
+class OutboundScheduler:
+    """
+    Gives one transaction at a time exclusive use of the link to the device, so
+    the packets of concurrent sends never interleave. Waiting transactions are
+    granted the link in priority order, and in arrival order within a priority.
+
+    Long operations that run as many transactions (such as file transfers at
+    PRIORITY_BULK) are thereby pre-empted between transactions by anything more
+    urgent. A waiter that is cancelled simply leaves the queue; one cancelled
+    just as it was granted the link passes it on.
+    """
+
+    def __init__(self):
+        self.busy = False
+        self.waiters = []
+        self.sequence = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, priority=PRIORITY_NORMAL):
+        """Async context manager holding the link for the body of the block."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority=PRIORITY_NORMAL):
+        """Wait for exclusive use of the link."""
+        if not self.busy:
+            self.busy = True
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Hand the link to the most urgent waiter, or free it."""
+        waiters = self.waiters
+        while waiters:
+            _, _, waiter = heapq.heappop(waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.busy = False
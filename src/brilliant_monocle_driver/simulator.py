@@ -0,0 +1,207 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import re
+from .batched import batched
+from .discovery import NUS_RX_UUID, NUS_TX_UUID
+from .exceptions import MonocleException
+from .raw_repl import RAW_REPL_BANNER
+from .transport import MonocleTransport
+
+FRIENDLY_REPL_PROMPT = b"\r\n>>> "
+CONTROL_BYTES = re.compile(b"[\x01-\x04]")
+
+
+class SimulatedCharacteristic:
+    """
+    Stand-in for a Bleak GATT characteristic, passed as the channel to
+    notify callbacks by SimulatedTransport.
+    """
+
+    def __init__(self, uuid, description, handle, properties):
+        self.uuid = uuid
+        self.description = description
+        self.handle = handle
+        self.properties = properties
+
+    def __repr__(self):
+        return "SimulatedCharacteristic({})".format(self.description)
+
+
+class SimulatedTransport(MonocleTransport):
+    """
+    In-process loopback transport that behaves like a Monocle running its
+    default firmware: writes land on an emulated Nordic UART RX characteristic,
+    the MicroPython raw REPL framing (Ctrl-C, Ctrl-A ... Ctrl-D) is honored,
+    and output comes back as TX notifications split at the MTU.
+
+    script_handler, if provided, is called with the source of every script
+    executed in the raw REPL and may return None, a stdout string, or a
+    (stdout, stderr) tuple; stdout may also be bytes, e.g. to emit binary
+    records. latency is the delay in seconds applied to every packet in either
+    direction; acknowledged writes wait a further latency for the
+    acknowledgement to come back.
+    """
+
+    def __init__(self, address="SIM:00:00:00:00:00", mtu_size=128, latency=0.0,
+                 script_handler=None, record_scripts=True, write_without_response=True):
+        self.address = address
+        self.mtu_size = mtu_size
+        self.latency = latency
+        self.script_handler = script_handler
+        self.record_scripts = record_scripts
+
+        rx_properties = ["write"]
+        if write_without_response:
+            rx_properties.append("write-without-response")
+        self.rx_characteristic = SimulatedCharacteristic(
+            NUS_RX_UUID, "Nordic UART RX", 1, rx_properties)
+        self.tx_characteristic = SimulatedCharacteristic(
+            NUS_TX_UUID, "Nordic UART TX", 2, ["notify"])
+
+        self.available = True
+        self.connected = False
+        self.notify_callback = None
+        self.disconnected_callback = None
+        self.raw_mode = False
+        self.script_buffer = bytearray()
+        self.executed_scripts = []
+        self.receive_lock = None
+
+        self.packets_written = 0
+        self.bytes_written = 0
+        self.packets_notified = 0
+        self.bytes_notified = 0
+
+    async def find_addresses(self):
+        return [self.address]
+
+    async def connect(self, address, notify_callback, disconnected_callback=None):
+        if address != self.address or not self.available:
+            raise MonocleException("No simulated device at {}".format(address))
+        self.notify_callback = notify_callback
+        self.disconnected_callback = disconnected_callback
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+        self.notify_callback = None
+        self.disconnected_callback = None
+        self.raw_mode = False
+        self.script_buffer = bytearray()
+
+    def simulate_disconnect(self):
+        """
+        Drop the link as if the device went out of range, notifying the host
+        through the disconnected callback.
+        """
+        if not self.connected:
+            return
+        callback = self.disconnected_callback
+        self.connected = False
+        self.notify_callback = None
+        self.disconnected_callback = None
+        self.raw_mode = False
+        self.script_buffer = bytearray()
+        if callback is not None:
+            callback()
+
+    @property
+    def is_connected(self):
+        return self.connected
+
+    async def write(self, data, response=True):
+        if not self.connected:
+            raise MonocleException("Simulated device is not connected.")
+        if len(data) > self.mtu_size - 3:
+            raise MonocleException("Write of {} bytes exceeds MTU of {}".format(
+                len(data), self.mtu_size))
+        if not response and not self.supports_write_without_response:
+            raise MonocleException("Simulated RX characteristic does not support "
+                                   "write without response.")
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        self.packets_written += 1
+        self.bytes_written += len(data)
+        # Like the device, finish with one packet before starting on the next,
+        # even while a reply to it is being notified.
+        if self.receive_lock is None:
+            self.receive_lock = asyncio.Lock()
+        async with self.receive_lock:
+            await self._receive(bytes(data))
+
+        if response and self.latency:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def supports_write_without_response(self):
+        return "write-without-response" in self.rx_characteristic.properties
+
+    async def notify(self, data):
+        """
+        Send data from the simulated device to the host, split into
+        MTU-sized notification packets.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+
+        for packet in batched(data, self.mtu_size - 3):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.notify_callback is None:
+                return
+            self.packets_notified += 1
+            self.bytes_notified += len(packet)
+            self.notify_callback(self.tx_characteristic, bytearray(packet))
+
+    async def _receive(self, data):
+        """Run bytes written by the host through the emulated REPL."""
+        start = 0
+        for match in CONTROL_BYTES.finditer(data):
+            index = match.start()
+            byte = data[index]
+            if byte == 0x04 and not self.raw_mode:
+                continue
+
+            self._buffer(data, start, index)
+            start = index + 1
+            if byte == 0x03:
+                # Ctrl-C: interrupt. Nothing is running, so just drop any
+                # partially-received script.
+                self.script_buffer = bytearray()
+            elif byte == 0x01:
+                self.raw_mode = True
+                self.script_buffer = bytearray()
+                await self.notify(RAW_REPL_BANNER)
+            elif byte == 0x02:
+                self.raw_mode = False
+                await self.notify(FRIENDLY_REPL_PROMPT)
+            else:
+                await self._execute()
+        self._buffer(data, start, len(data))
+
+    def _buffer(self, data, start, end):
+        if self.raw_mode and end > start:
+            self.script_buffer += data[start:end]
+
+    async def _execute(self):
+        script = self.script_buffer.decode("utf-8", errors="replace")
+        self.script_buffer = bytearray()
+        if self.record_scripts:
+            self.executed_scripts.append(script)
+
+        stdout = ""
+        stderr = ""
+        if self.script_handler is not None:
+            result = self.script_handler(script)
+            if isinstance(result, tuple):
+                stdout, stderr = result
+            elif result is not None:
+                stdout = result
+
+        if isinstance(stdout, str):
+            stdout = stdout.encode()
+        await self.notify(b"OK" + stdout + b"\x04" + stderr.encode() + b"\x04>")
@@ -0,0 +1,56 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+from .dispatch import DROP_NEWEST, DROP_OLDEST
+
+_CLOSED = object()
+
+
+class Stream:
+    """
+    Bounded buffer between a synchronous producer (a listener called as data
+    arrives) and an async consumer iterating over it with `async for`.
+
+    Producers never block: if the consumer falls behind and the buffer is full,
+    overflow decides whether the new item (DROP_NEWEST) or the oldest buffered
+    one (DROP_OLDEST) is discarded, and dropped counts the discards.
+    """
+
+    def __init__(self, max_size=256, overflow=DROP_OLDEST):
+        if overflow not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError("Unknown overflow policy {!r}".format(overflow))
+
+        # One extra slot so close() always has room for its marker.
+        self.queue = asyncio.Queue(max_size + 1)
+        self.max_size = max_size
+        self.overflow = overflow
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, item):
+        """Add an item for the consumer."""
+        if self.closed:
+            return
+        queue = self.queue
+        if queue.qsize() >= self.max_size:
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+    def close(self):
+        """End the stream once the consumer has read the items already buffered."""
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
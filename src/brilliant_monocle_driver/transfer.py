@@ -0,0 +1,451 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import base64
+import io
+import logging
+import time
+import zlib
+from .exceptions import MonocleException
+from .records import RecordType
+from .scheduler import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+# Bytes of file content carried by each upload block, and blocks per
+# transaction.
+UPLOAD_BLOCK_SIZE = 1536
+UPLOAD_BLOCKS_PER_TRANSACTION = 4
+
+# Bytes of file content per record when downloading, and per transaction, so
+# other commands can run between the segments of a long download.
+DOWNLOAD_BLOCK_SIZE = 512
+DOWNLOAD_SEGMENT_SIZE = 65536
+
+# Binary records a download arrives in: a block of the file (little-endian
+# uint32 offset, then data), and the end of a segment (segment end offset, file
+# size, CRC-32 of the segment).
+TRANSFER_DATA = RecordType(0xF0, "transfer-data")
+TRANSFER_END = RecordType(0xF1, "transfer-end", "<III")
+
+# Suffix of the file an upload is written to until it is complete.
+PART_SUFFIX = ".part"
+
+# MicroPython defining the device side of file transfers. Blocks are appended
+# only at the offset the host expects and only if their CRC matches, and every
+# reply reports the size the file actually has, so the host can always resume
+# from what the device holds. Downloads are sent back as binary records.
+TRANSFER_RECEIVER_COMMAND = """
+import os, struct, sys, ubinascii
+try:
+    _xfer_crc = ubinascii.crc32
+except AttributeError:
+    def _xfer_crc(data, crc=0):
+        crc = ~crc & 0xffffffff
+        for b in data:
+            crc ^= b
+            for _ in range(8):
+                crc = (crc >> 1) ^ (0xedb88320 & -(crc & 1))
+        return ~crc & 0xffffffff
+def _xfer_size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+def _xfer_status(path):
+    size = 0
+    crc = 0
+    try:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(512)
+                if not data:
+                    break
+                size += len(data)
+                crc = _xfer_crc(data, crc)
+    except OSError:
+        pass
+    print(size, crc & 0xffffffff)
+def _xfer_put(path, offset, data, crc):
+    data = ubinascii.a2b_base64(data)
+    if _xfer_crc(data) & 0xffffffff != crc:
+        print("CRC", _xfer_size(path))
+        return
+    size = _xfer_size(path)
+    if size == offset:
+        with open(path, "ab") as f:
+            f.write(data)
+        size += len(data)
+    print("AT", size)
+def _xfer_finish(part, path):
+    open(part, "ab").close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    os.rename(part, path)
+def _xfer_record(out, type_id, head, body=b""):
+    n = len(head) + len(body)
+    out.write(struct.pack("<BBHB", 0xFE, type_id, n, ~(type_id + (n & 0xFF) + (n >> 8)) & 0xFF))
+    out.write(head)
+    out.write(body)
+    out.write(bytes(((sum(head) + sum(body)) & 0xFF,)))
+def _xfer_get(path, offset, length, block):
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+    view = memoryview(bytearray(block))
+    crc = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            n = f.readinto(view[:min(block, length)])
+            if not n:
+                break
+            _xfer_record(out, 0xF0, struct.pack("<I", offset), view[:n])
+            crc = _xfer_crc(view[:n], crc)
+            offset += n
+            length -= n
+    _xfer_record(out, 0xF1, struct.pack("<III", offset, os.stat(path)[6], crc & 0xffffffff))
+"""
+
+
+class TransferResult:
+    """
+    Outcome of a file transfer: the device path, the file size, the bytes
+    actually carried over the link (less than size when a transfer resumed)
+    and the elapsed seconds.
+    """
+
+    def __init__(self, path, size, transferred, elapsed):
+        self.path = path
+        self.size = size
+        self.transferred = transferred
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        """Bytes transferred per second."""
+        return self.transferred / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return "TransferResult(path={!r}, size={}, transferred={}, elapsed={:.3f})".format(
+            self.path, self.size, self.transferred, self.elapsed)
+
+
+def _open_source(source):
+    """A binary file object for source: bytes-like data, a path, or a file object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, "read"):
+        return source
+    return open(source, "rb")
+
+
+def _can_wait_for_reconnect(monocle):
+    """
+    Whether a transfer interrupted by a dropped link should wait for the
+    Monocle to reconnect. Not when the transfer is itself part of the reconnect
+    (restoring helper modules), as nothing else would reconnect meanwhile; the
+    reconnect then fails and is retried.
+    """
+    return monocle.auto_reconnect and asyncio.current_task() is not monocle.reconnect_task
+
+
+def _crc(f, length):
+    """CRC-32 of the first length bytes of f."""
+    f.seek(0)
+    crc = 0
+    while length > 0:
+        data = f.read(min(length, 65536))
+        if not data:
+            break
+        crc = zlib.crc32(data, crc)
+        length -= len(data)
+    return crc
+
+
+class Upload:
+    """
+    Streams a file to the device filesystem in CRC-checked blocks, resuming
+    from the data already on the device after errors and disconnects. Each
+    transaction carries blocks_per_transaction blocks, so the round trip to
+    the device is paid once per group of blocks. Created by
+    Monocle.upload_file().
+    """
+
+    def __init__(self, monocle, source, path, block_size=UPLOAD_BLOCK_SIZE, progress=None,
+                 max_retries=5, reconnect_timeout=60.0, priority=PRIORITY_BULK,
+                 blocks_per_transaction=UPLOAD_BLOCKS_PER_TRANSACTION):
+        self.monocle = monocle
+        self.source = source
+        self.path = path
+        self.part_path = path + PART_SUFFIX
+        self.block_size = block_size
+        self.blocks_per_transaction = blocks_per_transaction
+        self.progress = progress
+        self.max_retries = max_retries
+        self.reconnect_timeout = reconnect_timeout
+        self.priority = priority
+
+    async def run(self):
+        """
+        Upload the file. Returns a TransferResult.
+
+        Raises MonocleException if the upload fails max_retries times in a row,
+        or the link drops and does not come back.
+        """
+        monocle = self.monocle
+        start = time.perf_counter()
+        f = _open_source(self.source)
+        try:
+            size = f.seek(0, io.SEEK_END)
+            crc = _crc(f, size)
+            transferred = 0
+            failures = 0
+            offset = None
+            while True:
+                try:
+                    if offset is None:
+                        offset = await self._resume_offset(f, size)
+                    if offset >= size:
+                        break
+                    f.seek(offset)
+                    commands = []
+                    ends = []
+                    end = offset
+                    while len(commands) < self.blocks_per_transaction and end < size:
+                        data = f.read(self.block_size)
+                        commands.append("_xfer_put({!r},{},{!r},{})".format(
+                            self.part_path, end, base64.b64encode(data).decode(),
+                            zlib.crc32(data)))
+                        end += len(data)
+                        ends.append(end)
+                    reply = await self._execute("\n".join(commands))
+                except MonocleException as e:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise
+                    logger.info("Upload of %s interrupted at %s: %s", self.path, offset, e)
+                    offset = None
+                    if not monocle.connected:
+                        if not _can_wait_for_reconnect(monocle):
+                            raise
+                        await monocle.wait_until_connected(self.reconnect_timeout)
+                    continue
+
+                # Each block replies "AT <size>"; a block the device rejects
+                # leaves the size unchanged, so the blocks after it are
+                # rejected too.
+                for block_end, answer in zip(ends, zip(reply[0::2], reply[1::2])):
+                    if answer != ("AT", str(block_end)):
+                        break
+                    transferred += block_end - offset
+                    offset = block_end
+                    if self.progress is not None:
+                        self.progress(offset, size)
+                if offset == end:
+                    failures = 0
+                    continue
+
+                # Corrupted in transit, or the device holds something else
+                # than expected; check what it has and carry on from there.
+                failures += 1
+                if failures > self.max_retries:
+                    raise MonocleException("Upload of {} failed: device replied {}".format(
+                        self.path, " ".join(reply)))
+                offset = None
+
+            if await self._status() != (size, crc):
+                raise MonocleException("Upload of {} failed verification".format(self.path))
+            await self._execute("_xfer_finish({!r},{!r})".format(self.part_path, self.path))
+        finally:
+            if f is not self.source:
+                f.close()
+
+        return TransferResult(self.path, size, transferred, time.perf_counter() - start)
+
+    async def _execute(self, command):
+        """Run command, returning the words it printed."""
+        result = self.monocle._check(await self.monocle.execute(
+            command, priority=self.priority, preprocess=False))
+        return result.stdout.split()
+
+    async def _status(self):
+        """(size, CRC) of the partial file on the device."""
+        await self.monocle.install_transfer_receiver()
+        reply = await self._execute("_xfer_status({!r})".format(self.part_path))
+        return int(reply[0]), int(reply[1])
+
+    async def _resume_offset(self, f, size):
+        """
+        Where to continue uploading: the size of the partial file on the device
+        if it is a prefix of the file being uploaded, otherwise 0.
+        """
+        part_size, part_crc = await self._status()
+        if part_size <= size and part_crc == _crc(f, part_size):
+            if part_size:
+                logger.info("Resuming upload of %s at %s", self.path, part_size)
+            return part_size
+
+        await self._execute("os.remove({!r})".format(self.part_path))
+        return 0
+
+
+def _open_destination(destination):
+    """
+    An async write function for destination: a path, a binary file object, or
+    an async function taking bytes. Returns (write, file to close or None).
+    """
+    if hasattr(destination, "write"):
+        f = destination
+    elif callable(destination):
+        return destination, None
+    else:
+        f = open(destination, "wb")
+
+    async def write(data):
+        f.write(data)
+
+    return write, (f if f is not destination else None)
+
+
+class Download:
+    """
+    Streams a file from the device filesystem to a host file or async sink,
+    one segment per transaction, as binary records on the notify channel. Only
+    the block being written is held in memory. Created by
+    Monocle.download_file().
+    """
+
+    def __init__(self, monocle, path, destination, block_size=DOWNLOAD_BLOCK_SIZE,
+                 segment_size=DOWNLOAD_SEGMENT_SIZE, progress=None, max_retries=5,
+                 reconnect_timeout=60.0, timeout=60.0, priority=PRIORITY_BULK):
+        self.monocle = monocle
+        self.path = path
+        self.destination = destination
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self.progress = progress
+        self.max_retries = max_retries
+        self.reconnect_timeout = reconnect_timeout
+        self.timeout = timeout
+        self.priority = priority
+        self.size = None
+        self.received = 0
+
+    async def run(self):
+        """
+        Download the file. Returns a TransferResult.
+
+        Raises MonocleException if the file cannot be read, fails its checksum,
+        or the link drops more than max_retries times in a row (or at all
+        without auto_reconnect).
+        """
+        monocle = self.monocle
+        start = time.perf_counter()
+        queue = asyncio.Queue()
+        tokens = [
+            monocle._add_record_listener(
+                TRANSFER_DATA, lambda payload: queue.put_nowait((TRANSFER_DATA, payload))),
+            monocle._add_record_listener(
+                TRANSFER_END, lambda values: queue.put_nowait((TRANSFER_END, values))),
+        ]
+        write, opened = _open_destination(self.destination)
+        self.received = 0
+        try:
+            failures = 0
+            while self.size is None or self.received < self.size:
+                connections = monocle.connections
+                try:
+                    await monocle.install_transfer_receiver()
+                    await self._segment(queue, write)
+                    failures = 0
+                except MonocleException:
+                    failures += 1
+                    dropped = not monocle.connected or monocle.connections != connections
+                    if (not dropped or not _can_wait_for_reconnect(monocle)
+                            or failures > self.max_retries):
+                        raise
+                    logger.info("Download of %s interrupted at %s", self.path, self.received)
+                    await monocle.wait_until_connected(self.reconnect_timeout)
+                    # The next segment starts after the last block written;
+                    # records still queued from the interrupted one are stale.
+                    while not queue.empty():
+                        queue.get_nowait()
+        finally:
+            for token in tokens:
+                monocle.remove_record_listener(token)
+            if opened is not None:
+                opened.close()
+
+        return TransferResult(self.path, self.size, self.received, time.perf_counter() - start)
+
+    async def _segment(self, queue, write):
+        """
+        Fetch one segment starting at self.received, writing each block as it
+        arrives and advancing self.received past it, so an interrupted segment
+        is resumed after the last block written.
+        """
+        offset = self.received
+        command = "_xfer_get({!r},{},{},{})".format(
+            self.path, offset, self.segment_size, self.block_size)
+        execution = asyncio.ensure_future(self.monocle.execute(
+            command, self.timeout, priority=self.priority, preprocess=False))
+        crc = 0
+        try:
+            while True:
+                kind, value = await self._next_record(queue, execution)
+                if kind is TRANSFER_END:
+                    break
+                block_offset = int.from_bytes(value[:4], "little")
+                if block_offset != offset:
+                    raise MonocleException("Download of {} expected offset {}, got {}".format(
+                        self.path, offset, block_offset))
+                data = value[4:]
+                await write(data)
+                crc = zlib.crc32(data, crc)
+                offset += len(data)
+                self.received = offset
+                if self.progress is not None:
+                    self.progress(offset, self.size)
+
+            end, self.size, device_crc = value
+            if end != offset or device_crc != crc:
+                raise MonocleException("Download of {} failed verification".format(self.path))
+            self.monocle._check(await execution)
+            if self.progress is not None:
+                self.progress(offset, self.size)
+        finally:
+            if not execution.done():
+                execution.cancel()
+            await asyncio.gather(execution, return_exceptions=True)
+
+    async def _next_record(self, queue, execution):
+        """
+        The next queued record. If the command ends first, its error is raised;
+        if it succeeded, its records may still be on their way from a
+        NotificationDispatcher.
+        """
+        if not queue.empty():
+            return queue.get_nowait()
+        if execution.done():
+            self.monocle._check(execution.result())
+            return await self._get(queue)
+
+        get = asyncio.ensure_future(queue.get())
+        try:
+            await asyncio.wait((get, execution), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not get.done():
+                get.cancel()
+        if get.done() and not get.cancelled():
+            return get.result()
+        self.monocle._check(execution.result())
+        return await self._get(queue)
+
+    async def _get(self, queue):
+        try:
+            return await asyncio.wait_for(queue.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise MonocleException("Timed out after {} seconds waiting for {}".format(
+                self.timeout, self.path))
@@ -0,0 +1,238 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import logging
+from bleak import BleakScanner, BleakClient
+from .discovery import DiscoveryCache, is_monocle, NUS_SERVICE_UUID, NUS_RX_UUID, NUS_TX_UUID
+from .exceptions import MonocleException
+
+logger = logging.getLogger(__name__)
+
+
+class MonocleTransport:
+    """
+    The link a Monocle uses to talk to a device. Subclasses provide discovery,
+    connection, and raw writes to the device's UART RX characteristic, and
+    deliver the device's UART TX notifications to the callback passed to
+    connect().
+    """
+
+    # The MTU negotiated for the current connection, or None if unknown.
+    mtu_size = None
+
+    async def find_addresses(self):
+        """
+        Find the addresses of all devices that can be reached, in a single scan.
+        """
+        raise NotImplementedError()
+
+    async def find_address(self):
+        """
+        Find the address of exactly one device.
+
+        Raises MonocleException if zero or more than one device is found.
+        """
+        addresses = await self.find_addresses()
+        if len(addresses) != 1:
+            raise MonocleException("Expected 1 device, found {}".format(len(addresses)))
+        return addresses[0]
+
+    async def connect(self, address, notify_callback, disconnected_callback=None):
+        """
+        Connect to the device at address. notify_callback is called with
+        (channel, bytes_in) for every notification received from the device.
+        disconnected_callback, if provided, is called with no arguments when
+        the link drops.
+        """
+        raise NotImplementedError()
+
+    async def disconnect(self):
+        """
+        Disconnect from the device, if connected.
+        """
+        raise NotImplementedError()
+
+    async def write(self, data, response=True):
+        """
+        Write one packet of data (no larger than the MTU allows) to the device.
+        If response is False, the write is sent without waiting for the device
+        to acknowledge it.
+        """
+        raise NotImplementedError()
+
+    @property
+    def is_connected(self):
+        """
+        True while the link to the device is up. Polled by the Monocle's
+        keepalive to notice a link that dropped without a callback.
+        """
+        raise NotImplementedError()
+
+    @property
+    def supports_write_without_response(self):
+        """True if the connected device accepts writes without response."""
+        return False
+
+
+class BleakTransport(MonocleTransport):
+    """
+    Transport that talks to a physical Monocle over BLE via Bleak.
+
+    cache is the DiscoveryCache of Monocles this host has connected to; a
+    default one in the user's cache directory is used if it is None, and none
+    at all if it is False. find_address() stops scanning as soon as a known
+    Monocle is seen, and the UART characteristics are looked up by their
+    recorded handles. If first_found is True, find_address() also stops at the
+    first Monocle seen, known or not, rather than scanning for scan_timeout
+    seconds to make sure there is exactly one.
+    """
+
+    def __init__(self, cache=None, scan_timeout=5.0, first_found=False):
+        if cache is None:
+            cache = DiscoveryCache()
+        self.cache = cache if cache is not False else None
+        self.scan_timeout = scan_timeout
+        self.first_found = first_found
+        self.client = None
+        self.rx_characteristic = None
+        self.tx_characteristic = None
+
+    async def find_addresses(self):
+        """
+        Finds the addresses of all monocles seen in one scan.
+        """
+        return await self._scan()
+
+    async def find_address(self):
+        """
+        Finds the address of one monocle. If a monocle this host has connected to
+        before is seen (or any monocle, with first_found), scanning stops and it
+        is returned immediately. Otherwise raises an exception if zero or more
+        than one are found.
+        """
+        known = set(self.cache.addresses()) if self.cache is not None else set()
+        addresses = await self._scan(stop_on=known, stop_on_any=self.first_found)
+        for address in addresses:
+            if address in known:
+                return address
+        if self.first_found and addresses:
+            return addresses[0]
+        if len(addresses) != 1:
+            raise MonocleException("Expected 1 device, found {}".format(len(addresses)))
+        return addresses[0]
+
+    async def _scan(self, stop_on=(), stop_on_any=False):
+        """
+        Scan for monocles for up to scan_timeout seconds, stopping early if one
+        whose address is in stop_on (or, with stop_on_any, any one) is seen.
+        Returns the addresses found.
+        """
+        logger.info("Scanning for devices...")
+        found = []
+        seen_known = asyncio.Event()
+
+        def on_detection(device, advertisement_data):
+            if device.address in found or not is_monocle(device, advertisement_data):
+                return
+            found.append(device.address)
+            if stop_on_any or device.address in stop_on:
+                seen_known.set()
+
+        # Filtering on the UART service lets the OS drop unrelated devices.
+        async with BleakScanner(detection_callback=on_detection,
+                                service_uuids=[NUS_SERVICE_UUID]):
+            try:
+                await asyncio.wait_for(seen_known.wait(), self.scan_timeout)
+            except asyncio.TimeoutError:
+                pass
+        return found
+
+    async def connect(self, address, notify_callback, disconnected_callback=None):
+        client, rx_characteristic, tx_characteristic = await self._get_uart(
+            address, disconnected_callback)
+
+        await client.start_notify(tx_characteristic, notify_callback)
+
+        self.client = client
+        self.rx_characteristic = rx_characteristic
+        self.tx_characteristic = tx_characteristic
+
+    async def disconnect(self):
+        if self.client is None:
+            return
+
+        await self.client.disconnect()
+        self.client = None
+        self.rx_characteristic = None
+        self.tx_characteristic = None
+
+    async def write(self, data, response=True):
+        await self.client.write_gatt_char(self.rx_characteristic, data, response=response)
+
+    @property
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected
+
+    @property
+    def mtu_size(self):
+        # Derived from the largest write the RX characteristic accepts, which
+        # Bleak reports on every backend without private API; it may read as
+        # the default of 20 until the platform has negotiated a larger MTU.
+        if self.rx_characteristic is None:
+            return None
+        return self.rx_characteristic.max_write_without_response_size + 3
+
+    @property
+    def supports_write_without_response(self):
+        return (self.rx_characteristic is not None
+                and "write-without-response" in self.rx_characteristic.properties)
+
+    async def _get_uart(self, address, disconnected_callback=None):
+        """
+        Get UART endpoints for the monocle at address
+
+        Raises MonocleException if no UART endpoints can be found.
+
+        Returns the BLE client, rx, and tx endpoints
+        """
+        on_disconnect = None
+        if disconnected_callback is not None:
+            on_disconnect = lambda client: disconnected_callback()
+        client = BleakClient(address, disconnected_callback=on_disconnect)
+        await client.connect()
+        logger.info("Finding UART channel for %s...", address)
+
+        rx_characteristic = None
+        tx_characteristic = None
+        handles = self.cache.handles(address) if self.cache is not None else None
+        if handles is not None:
+            rx_characteristic = client.services.get_characteristic(handles[0])
+            tx_characteristic = client.services.get_characteristic(handles[1])
+            if (rx_characteristic is None or rx_characteristic.uuid != NUS_RX_UUID
+                    or tx_characteristic is None or tx_characteristic.uuid != NUS_TX_UUID):
+                logger.info("Cached handles for %s are stale.", address)
+                rx_characteristic = None
+                tx_characteristic = None
+
+        if rx_characteristic is None:
+            uart_service = client.services.get_service(NUS_SERVICE_UUID)
+            if uart_service is None:
+                raise MonocleException("No UART service found at {}".format(address))
+
+            logger.info("Found UART service.")
+
+            tx_characteristic = uart_service.get_characteristic(NUS_TX_UUID)
+            rx_characteristic = uart_service.get_characteristic(NUS_RX_UUID)
+
+        if tx_characteristic is None:
+            raise MonocleException("Unable to find TX characteristic at {}".format(
+                address))
+        if rx_characteristic is None:
+            raise MonocleException("Unable to find RX characteristic at {}".format(
+                    address))
+
+        if self.cache is not None:
+            self.cache.remember(address, rx_characteristic.handle, tx_characteristic.handle)
+
+        return client, rx_characteristic, tx_characteristic
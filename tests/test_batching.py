@@ -0,0 +1,76 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import unittest
+from brilliant_monocle_driver import Monocle, SimulatedTransport, PRIORITY_HIGH
+from brilliant_monocle_driver.batching import CommandBatch
+
+
+class RecordingMonocle:
+    """Stands in for a Monocle, recording what each send() was given."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, command, priority):
+        self.sent.append((command, priority))
+
+
+class CommandBatchTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_context_manager_sends_once_on_exit(self):
+        transport = SimulatedTransport()
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            async with monocle.batch() as batch:
+                batch.add("a = 1")
+                batch.add("b = 2")
+                self.assertEqual(transport.executed_scripts, [])
+        self.assertEqual(transport.executed_scripts, ["a = 1\r\nb = 2"])
+
+    async def test_flush_interval(self):
+        monocle = RecordingMonocle()
+        batch = CommandBatch(monocle, flush_interval=0.05, priority=PRIORITY_HIGH)
+        batch.add("a = 1")
+        await asyncio.sleep(0.02)
+        batch.add("b = 2")
+        self.assertEqual(monocle.sent, [])
+
+        await asyncio.sleep(0.06)
+        self.assertEqual(monocle.sent, [("a = 1\nb = 2", PRIORITY_HIGH)])
+
+    async def test_max_size(self):
+        monocle = RecordingMonocle()
+        async with CommandBatch(monocle, max_size=12) as batch:
+            batch.add("a = 1")
+            batch.add("b = 2")
+            await asyncio.sleep(0)
+            self.assertEqual([command for command, _ in monocle.sent], ["a = 1\nb = 2"])
+            batch.add("c = 3")
+        self.assertEqual([command for command, _ in monocle.sent], ["a = 1\nb = 2", "c = 3"])
+
+    async def test_max_size_flush_cancels_interval_timer(self):
+        monocle = RecordingMonocle()
+        batch = CommandBatch(monocle, flush_interval=0.2, max_size=12)
+        batch.add("a = 1")
+        await asyncio.sleep(0.05)
+        batch.add("b = 2")
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(monocle.sent), 1)
+
+        # Its own flush_interval runs from now, not from the first command.
+        batch.add("c = 3")
+        await asyncio.sleep(0.15)
+        self.assertEqual(len(monocle.sent), 1)
+        await asyncio.sleep(0.1)
+        self.assertEqual([command for command, _ in monocle.sent], ["a = 1\nb = 2", "c = 3"])
+
+    async def test_empty_flush_sends_nothing(self):
+        monocle = RecordingMonocle()
+        await CommandBatch(monocle).flush()
+        self.assertEqual(monocle.sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
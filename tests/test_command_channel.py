@@ -0,0 +1,116 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import binascii
+import contextlib
+import io
+import sys
+import types
+import unittest
+from unittest import mock
+from brilliant_monocle_driver import Monocle, MonocleException, SimulatedTransport
+from brilliant_monocle_driver.command_channel import (COMMAND_DISPATCHER_COMMAND, encode_command,
+                                                      parse_command_event)
+
+
+def fake_uselect(stdin):
+    """Stands in for MicroPython's uselect, polling stdin for unread input."""
+
+    class Poll:
+        def register(self, stream, events):
+            pass
+
+        def poll(self, timeout):
+            return stdin.tell() < len(stdin.getvalue())
+
+    return types.SimpleNamespace(poll=Poll, POLLIN=1)
+
+
+def run_dispatcher(input):
+    """
+    Run the device's poll_commands() in this process on input (bytes written
+    to the command channel). Returns (what it printed, the namespace commands
+    ran in).
+    """
+    stdin = io.StringIO(input.decode())
+    output = io.StringIO()
+    namespace = {}
+    modules = {"uselect": fake_uselect(stdin), "ubinascii": binascii}
+    with mock.patch.dict(sys.modules, modules), mock.patch.object(sys, "stdin", stdin), \
+            contextlib.redirect_stdout(output):
+        exec(COMMAND_DISPATCHER_COMMAND, namespace)
+        namespace["poll_commands"]()
+    return output.getvalue(), namespace
+
+
+class CommandChannelTest(unittest.TestCase):
+
+    def test_encode_command(self):
+        self.assertEqual(encode_command(7, "x = 1"), b"\n7 8 eCA9IDE=\n")
+        self.assertEqual(encode_command(7, b"x = 1"), encode_command(7, "x = 1"))
+
+    def test_parse_command_event(self):
+        self.assertEqual(parse_command_event(" 7"), ("7", None))
+        self.assertEqual(parse_command_event(" 7 NameError('y')"), ("7", "NameError('y')"))
+
+    def test_dispatcher_runs_commands(self):
+        output, namespace = run_dispatcher(
+            encode_command(1, "x = 1") + encode_command(2, "y = x + 1\nz = undefined"))
+        self.assertEqual((namespace["x"], namespace["y"]), (1, 2))
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "[EVENT:command] 1")
+        tag, error = parse_command_event(lines[1][len("[EVENT:command]"):])
+        self.assertEqual(tag, "2")
+        self.assertIn("NameError", error)
+
+    def test_dispatcher_drops_truncated_line(self):
+        truncated = encode_command(1, "x = 1")[:-4]
+        output, namespace = run_dispatcher(truncated + encode_command(2, "y = 2"))
+        self.assertNotIn("x", namespace)
+        self.assertEqual(namespace["y"], 2)
+        self.assertEqual(output, "[EVENT:command] 2\n")
+
+
+class SendCommandTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_requires_dispatcher(self):
+        monocle = Monocle(transport=SimulatedTransport())
+        async with monocle:
+            with self.assertRaises(MonocleException):
+                await monocle.send_command("x = 1")
+
+    async def test_wait_for_result(self):
+        transport = SimulatedTransport()
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            await monocle.install_command_dispatcher(start_loop=False)
+            command = asyncio.ensure_future(monocle.send_command("x = 1", wait=True))
+            failing = asyncio.ensure_future(monocle.send_command("y = z", wait=True))
+            await asyncio.sleep(0.01)
+            await transport.notify(b"[EVENT:command] 2 NameError('z')\r\n")
+            await transport.notify(b"[EVENT:command] 1\r\n")
+            await command
+            with self.assertRaises(MonocleException):
+                await failing
+
+    async def test_disconnect_while_waiting_for_link(self):
+        transport = SimulatedTransport(latency=0.01)
+        monocle = Monocle(transport=transport)
+        await monocle.connect()
+        await monocle.install_command_dispatcher(start_loop=False)
+
+        sending = asyncio.ensure_future(monocle.send("x = 1\n" * 100))
+        await asyncio.sleep(0.02)
+        command = asyncio.ensure_future(monocle.send_command("y = 2"))
+        await asyncio.sleep(0.02)
+        transport.simulate_disconnect()
+
+        with self.assertRaises(MonocleException):
+            await command
+        await asyncio.gather(sending, return_exceptions=True)
+        await monocle.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import concurrent.futures
+import threading
+import unittest
+from brilliant_monocle_driver import (Monocle, NotificationDispatcher, SimulatedTransport,
+                                      DROP_NEWEST, DROP_OLDEST)
+
+
+class NotificationDispatcherTest(unittest.IsolatedAsyncioTestCase):
+
+    async def dispatch(self, overflow):
+        dispatcher = NotificationDispatcher(max_queue_size=3, overflow=overflow)
+        handled = []
+        dispatcher.start(lambda channel, data: handled.append(data))
+        # Queued without yielding, so the dispatcher task cannot keep up.
+        for index in range(5):
+            dispatcher.put(None, index)
+        await dispatcher.stop()
+        return dispatcher, handled
+
+    async def test_drop_newest(self):
+        dispatcher, handled = await self.dispatch(DROP_NEWEST)
+        self.assertEqual(handled, [0, 1, 2])
+        self.assertEqual(dispatcher.dropped, 2)
+        self.assertEqual(dispatcher.dispatched, 3)
+
+    async def test_drop_oldest(self):
+        dispatcher, handled = await self.dispatch(DROP_OLDEST)
+        self.assertEqual(handled, [2, 3, 4])
+        self.assertEqual(dispatcher.dropped, 2)
+        self.assertEqual(dispatcher.dispatched, 3)
+
+    async def test_handler_errors_are_counted(self):
+        def handler(channel, data):
+            if not data:
+                raise ValueError("empty")
+
+        dispatcher = NotificationDispatcher()
+        dispatcher.start(handler)
+        dispatcher.put(None, 0)
+        dispatcher.put(None, 1)
+        with self.assertLogs("brilliant_monocle_driver.dispatch"):
+            await dispatcher.stop()
+        self.assertEqual((dispatcher.errors, dispatcher.dispatched), (1, 1))
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            NotificationDispatcher(overflow="drop-everything")
+
+
+class MonocleDispatchTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_executor_callbacks_run_in_order_off_the_loop(self):
+        calls = []
+        loop_thread = threading.get_ident()
+
+        def record(kind, value):
+            calls.append((kind, value, threading.get_ident() != loop_thread))
+
+        executor = concurrent.futures.ThreadPoolExecutor(2)
+        transport = SimulatedTransport(mtu_size=13)
+        monocle = Monocle(lambda channel, text: record("notify", text), transport=transport,
+                          dispatcher=NotificationDispatcher(executor=executor))
+        monocle.add_line_listener(lambda line: record("line", line))
+        monocle.add_event_listener("tick", lambda payload: record("event", payload))
+        try:
+            async with monocle:
+                await transport.notify(b"one\r\n[EVENT:tick] 1\r\ntwo\r\n")
+        finally:
+            executor.shutdown()
+
+        self.assertTrue(all(off_loop for _, _, off_loop in calls))
+        self.assertEqual("".join(value for kind, value, _ in calls if kind == "notify"),
+                         "one\r\n[EVENT:tick] 1\r\ntwo\r\n")
+        self.assertEqual([(kind, value) for kind, value, _ in calls if kind != "notify"],
+                         [("line", "one"), ("event", "1"), ("line", "[EVENT:tick] 1"),
+                          ("line", "two")])
+
+    async def test_disconnect_drains_queue(self):
+        lines = []
+        transport = SimulatedTransport()
+        monocle = Monocle(transport=transport, dispatcher=NotificationDispatcher())
+        monocle.add_line_listener(lines.append)
+        await monocle.connect()
+        for index in range(100):
+            await transport.notify("line {}\r\n".format(index))
+        self.assertLess(len(lines), 100)
+
+        await monocle.disconnect()
+        self.assertEqual(lines, ["line {}".format(index) for index in range(100)])
+        self.assertFalse(monocle.dispatcher.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
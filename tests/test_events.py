@@ -0,0 +1,44 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import unittest
+from brilliant_monocle_driver.events import EventRouter, parse_events
+
+
+class ParseEventsTest(unittest.TestCase):
+
+    def test_single_tag(self):
+        self.assertEqual(list(parse_events(b"[EVENT:touch-A]")), [(b"touch-A", b"")])
+
+    def test_several_tags_with_payloads(self):
+        line = b"noise [EVENT:a] 1 2 [EVENT:b]x[EVENT:c]"
+        self.assertEqual(list(parse_events(line)), [(b"a", b"1 2"), (b"b", b"x"), (b"c", b"")])
+
+    def test_missing_close_bracket_ends_parsing(self):
+        self.assertEqual(list(parse_events(b"[EVENT:a] ok [EVENT:broken payload")),
+                         [(b"a", b"ok")])
+        self.assertEqual(list(parse_events(b"[EVENT:broken")), [])
+
+    def test_line_without_tags(self):
+        self.assertEqual(list(parse_events(b"EVENT: not a tag")), [])
+
+
+class EventRouterTest(unittest.TestCase):
+
+    def test_routes_by_name(self):
+        router = EventRouter()
+        received = []
+        router.add("a", lambda payload: received.append(("a", payload)))
+        token = router.add("b", lambda payload: received.append(("b", payload)))
+
+        router.route(b"[EVENT:a] caf\xc3\xa9 [EVENT:b] 2 [EVENT:unknown] 3")
+        self.assertEqual(received, [("a", "café"), ("b", "2")])
+
+        router.remove(token)
+        router.route(b"[EVENT:b] 2")
+        self.assertEqual(len(received), 2)
+        self.assertEqual(list(router.handlers), [b"a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
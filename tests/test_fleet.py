@@ -0,0 +1,80 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import unittest
+from brilliant_monocle_driver import MonocleException, MonocleFleet, SimulatedTransport
+
+ADDRESSES = ["SIM:00:00:00:00:0{}".format(index) for index in range(6)]
+
+
+class CountingTransport(SimulatedTransport):
+    """A SimulatedTransport whose connects take a while and are counted by the fleet test."""
+
+    def __init__(self, test, address):
+        super().__init__(address=address)
+        self.test = test
+
+    async def find_addresses(self):
+        return list(ADDRESSES)
+
+    async def connect(self, address, notify_callback, disconnected_callback=None):
+        self.test.connecting += 1
+        self.test.max_connecting = max(self.test.max_connecting, self.test.connecting)
+        try:
+            await asyncio.sleep(0.01)
+            await super().connect(address, notify_callback, disconnected_callback)
+        finally:
+            self.test.connecting -= 1
+
+
+class MonocleFleetTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.connecting = 0
+        self.max_connecting = 0
+        self.transports = {}
+
+    def make_transport(self, address):
+        transport = CountingTransport(self, address or ADDRESSES[0])
+        if address is not None:
+            transport.available = address != ADDRESSES[-1]
+            self.transports[address] = transport
+        return transport
+
+    async def test_connect_reports_per_address_and_bounds_concurrency(self):
+        fleet = MonocleFleet(transport_factory=self.make_transport, max_concurrency=2)
+        result = await fleet.connect()
+
+        self.assertEqual(sorted(result), ADDRESSES)
+        self.assertEqual(result.succeeded, ADDRESSES[:-1])
+        self.assertEqual(list(result.failed), [ADDRESSES[-1]])
+        self.assertIsInstance(result.failed[ADDRESSES[-1]], MonocleException)
+        self.assertEqual(sorted(fleet.monocles), ADDRESSES[:-1])
+        self.assertEqual(self.max_connecting, 2)
+        await fleet.disconnect()
+
+    async def test_send_to_subset(self):
+        fleet = MonocleFleet(transport_factory=self.make_transport)
+        await fleet.connect(ADDRESSES[:3])
+
+        result = await fleet.send("x = 1", addresses=ADDRESSES[1:4])
+        self.assertEqual(result.succeeded, ADDRESSES[1:3])
+        self.assertEqual(list(result.failed), [ADDRESSES[3]])
+        self.assertEqual(self.transports[ADDRESSES[0]].executed_scripts, [])
+        self.assertEqual(self.transports[ADDRESSES[1]].executed_scripts, ["x = 1"])
+        await fleet.disconnect()
+        self.assertEqual(fleet.monocles, {})
+
+    async def test_notifications_carry_address(self):
+        received = []
+        fleet = MonocleFleet(lambda address, channel, text: received.append((address, text)),
+                             transport_factory=self.make_transport)
+        await fleet.connect(ADDRESSES[:2])
+        await self.transports[ADDRESSES[1]].notify(b"hello")
+        self.assertEqual(received, [(ADDRESSES[1], "hello")])
+        await fleet.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
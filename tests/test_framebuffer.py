@@ -0,0 +1,177 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import base64
+import random
+import unittest
+from unittest import mock
+from brilliant_monocle_driver import Monocle, MonocleException, SimulatedTransport, framebuffer
+from brilliant_monocle_driver.framebuffer import FrameStreamer, dirty_rects, to_rgb565
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WIDTH = 40
+HEIGHT = 24
+
+
+def reference_rgb565(rgb):
+    """Big-endian RGB565 of packed RGB bytes, one pixel at a time."""
+    frame = bytearray()
+    for index in range(0, len(rgb), 3):
+        r, g, b = rgb[index:index + 3]
+        frame += (((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)).to_bytes(2, "big")
+    return bytes(frame)
+
+
+def random_rgb(width, height, seed=0):
+    return bytes(random.Random(seed).randrange(256) for _ in range(width * height * 3))
+
+
+def set_pixel(frame, width, x, y, value=b"\xff\xff"):
+    """A copy of RGB565 frame with pixel (x, y) changed."""
+    changed = bytearray(frame)
+    changed[(y * width + x) * 2:(y * width + x + 1) * 2] = value
+    return bytes(changed)
+
+
+class ToRgb565Test(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rgb = random_rgb(WIDTH, HEIGHT) + bytes([0, 0, 0, 255, 255, 255, 7, 3, 8, 8, 4, 7])
+        self.assertEqual(to_rgb565(rgb, WIDTH * HEIGHT + 4, 1), reference_rgb565(rgb))
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_numpy_matches_reference(self):
+        rgb = random_rgb(WIDTH, HEIGHT)
+        image = numpy.frombuffer(rgb, dtype=numpy.uint8).reshape(HEIGHT, WIDTH, 3)
+        self.assertEqual(to_rgb565(image, WIDTH, HEIGHT), reference_rgb565(rgb))
+
+    def test_wrong_size(self):
+        with self.assertRaises(MonocleException):
+            to_rgb565(bytes(WIDTH * HEIGHT * 3 - 1), WIDTH, HEIGHT)
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_numpy_wrong_shape(self):
+        with self.assertRaises(MonocleException):
+            to_rgb565(numpy.zeros((WIDTH, HEIGHT, 3), dtype=numpy.uint8), WIDTH, HEIGHT)
+
+
+class DirtyRectsTest(unittest.TestCase):
+    """Run on the NumPy path when it is available, and always on the pure path."""
+
+    def check(self):
+        frame = reference_rgb565(random_rgb(WIDTH, HEIGHT))
+        self.assertEqual(dirty_rects(None, frame, WIDTH, HEIGHT, 16), [(0, 0, WIDTH, HEIGHT)])
+        self.assertEqual(dirty_rects(frame, frame, WIDTH, HEIGHT, 16), [])
+
+        # Adjacent tiles in a row merge; the last column and row are partial.
+        changed = set_pixel(set_pixel(frame, WIDTH, 15, 0), WIDTH, 16, 0)
+        self.assertEqual(dirty_rects(frame, changed, WIDTH, HEIGHT, 16), [(0, 0, 32, 16)])
+        changed = set_pixel(set_pixel(frame, WIDTH, 0, 0), WIDTH, 39, 23)
+        self.assertEqual(dirty_rects(frame, changed, WIDTH, HEIGHT, 16),
+                         [(0, 0, 16, 16), (32, 16, 8, 8)])
+        changed = set_pixel(set_pixel(frame, WIDTH, 0, 20), WIDTH, 39, 20)
+        self.assertEqual(dirty_rects(frame, changed, WIDTH, HEIGHT, 16),
+                         [(0, 16, 16, 8), (32, 16, 8, 8)])
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_numpy(self):
+        self.check()
+
+    def test_pure_python(self):
+        with mock.patch.object(framebuffer, "numpy", None):
+            self.check()
+
+
+class DisplayEmulator:
+    """A script_handler drawing _fb_blit calls into an RGB565 frame."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.frame = bytearray(width * height * 2)
+        self.presented = 0
+
+    def blit(self, x, y, w, h, data):
+        pixels = base64.b64decode(data)
+        for row in range(h):
+            start = ((y + row) * self.width + x) * 2
+            self.frame[start:start + w * 2] = pixels[row * w * 2:(row + 1) * w * 2]
+
+    def present(self):
+        self.presented += 1
+
+    def __call__(self, script):
+        if "_fb_blit" in script and "def " not in script:
+            exec(script, {"_fb_blit": self.blit, "fb_present": self.present})
+
+
+class RecordingMonocle:
+    """Stands in for a Monocle with its command dispatcher installed."""
+
+    command_dispatcher = object()
+
+    def __init__(self):
+        self.commands = []
+
+    async def send_command(self, source, wait=False, preprocess=True):
+        self.commands.append((source, wait, preprocess))
+
+
+class FrameStreamerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_push_batches_blocks(self):
+        display = DisplayEmulator(WIDTH, HEIGHT)
+        transport = SimulatedTransport(script_handler=display)
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            streamer = monocle.frame_streamer(width=WIDTH, height=HEIGHT, tile_size=16,
+                                              max_block_bytes=160, max_transaction_bytes=1000,
+                                              present="fb_present")
+            await streamer.install()
+            del transport.executed_scripts[:]
+
+            rgb = random_rgb(WIDTH, HEIGHT)
+            self.assertEqual(await streamer.push(rgb), [(0, 0, WIDTH, HEIGHT)])
+
+        # 12 blocks of 2 rows, about 230 characters each, four to a command.
+        self.assertEqual(bytes(display.frame), reference_rgb565(rgb))
+        self.assertEqual(display.presented, 1)
+        self.assertEqual(len(transport.executed_scripts), 3)
+        self.assertTrue(all(len(script) <= 1000 for script in transport.executed_scripts))
+        self.assertTrue(transport.executed_scripts[-1].endswith("fb_present()"))
+
+    async def test_unchanged_frame_sends_nothing(self):
+        transport = SimulatedTransport(script_handler=DisplayEmulator(WIDTH, HEIGHT))
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            streamer = monocle.frame_streamer(width=WIDTH, height=HEIGHT, present="fb_present")
+            await streamer.push(random_rgb(WIDTH, HEIGHT))
+            del transport.executed_scripts[:]
+            self.assertEqual(await streamer.push(random_rgb(WIDTH, HEIGHT)), [])
+        self.assertEqual(transport.executed_scripts, [])
+
+    async def test_device_error(self):
+        transport = SimulatedTransport(script_handler=lambda script: ("", "NameError"))
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            streamer = monocle.frame_streamer(width=WIDTH, height=HEIGHT)
+            with self.assertRaises(MonocleException):
+                await streamer.push(random_rgb(WIDTH, HEIGHT))
+            self.assertIsNone(streamer.previous)
+
+    async def test_push_through_command_dispatcher(self):
+        monocle = RecordingMonocle()
+        streamer = FrameStreamer(monocle, width=WIDTH, height=HEIGHT, present="fb_present")
+        await streamer.push(random_rgb(WIDTH, HEIGHT))
+        self.assertEqual(len(monocle.commands), 1)
+        source, wait, preprocess = monocle.commands[0]
+        self.assertEqual((wait, preprocess), (True, False))
+        self.assertTrue(source.startswith("_fb_blit(0,0,40,12,"))
+        self.assertTrue(source.endswith("\nfb_present()"))
+
+
+if __name__ == "__main__":
+    unittest.main()
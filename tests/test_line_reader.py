@@ -0,0 +1,48 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import unittest
+from brilliant_monocle_driver.line_reader import LineReader
+
+
+class LineReaderTest(unittest.TestCase):
+
+    def test_splits_lines(self):
+        reader = LineReader()
+        reader.input("one\ntwo\nthr")
+        self.assertEqual(reader.get_lines(), ["one", "two"])
+        self.assertEqual(reader.current_line, "thr")
+        self.assertEqual(reader.get_lines(), [])
+
+        reader.input("ee\n")
+        self.assertEqual(reader.get_lines(), ["three"])
+        self.assertEqual(reader.current_line, "")
+
+    def test_separator_split_across_chunks(self):
+        reader = LineReader(b"\r\n")
+        for chunk in [b"first\r", b"\nsecond", b"\r", b"\n"]:
+            reader.input(chunk)
+        self.assertEqual(reader.get_raw_lines(), [b"first", b"second"])
+
+    def test_line_arriving_byte_by_byte(self):
+        reader = LineReader(b"\r\n")
+        for byte in b"a long line\r\nnext":
+            reader.input(bytes((byte,)))
+        self.assertEqual(reader.get_lines(), ["a long line"])
+        self.assertEqual(reader.current_line, "next")
+
+    def test_empty_lines(self):
+        reader = LineReader()
+        reader.input(b"\n\nx\n")
+        self.assertEqual(reader.get_lines(), ["", "", "x"])
+
+    def test_multibyte_character_split_across_chunks(self):
+        reader = LineReader()
+        encoded = "café\n".encode()
+        reader.input(encoded[:4])
+        reader.input(encoded[4:])
+        self.assertEqual(reader.get_lines(), ["café"])
+
+
+if __name__ == "__main__":
+    unittest.main()
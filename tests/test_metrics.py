@@ -0,0 +1,106 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import os
+import tempfile
+import unittest
+from brilliant_monocle_driver import Monocle, MonocleMetrics, SimulatedTransport
+from brilliant_monocle_driver.metrics import (MetricsRegistry, PrometheusFileExporter,
+                                              StatsdExporter, prometheus_text)
+
+
+def sample_registry():
+    registry = MetricsRegistry({"device": 'a"b'})
+    registry.counter("sent_total", "Bytes sent").inc(5)
+    latency = registry.histogram("latency_seconds", buckets=(0.1, 1))
+    latency.observe(0.1)
+    latency.observe(0.5)
+    latency.observe(2)
+    return registry
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def test_metrics_are_shared_by_name(self):
+        registry = MetricsRegistry()
+        self.assertIs(registry.counter("a"), registry.counter("a"))
+        with self.assertRaises(ValueError):
+            registry.histogram("a")
+
+    def test_histogram_buckets(self):
+        latency = sample_registry().histogram("latency_seconds")
+        self.assertEqual(latency.counts, [1, 1, 1])
+        self.assertEqual(latency.cumulative_counts(), [(0.1, 1), (1, 2), (float("inf"), 3)])
+        self.assertEqual((latency.count, latency.sum), (3, 2.6))
+
+
+class PrometheusTest(unittest.TestCase):
+
+    def test_text_format(self):
+        self.assertEqual(prometheus_text(sample_registry()), "\n".join([
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{device="a\\"b",le="0.1"} 1',
+            'latency_seconds_bucket{device="a\\"b",le="1.0"} 2',
+            'latency_seconds_bucket{device="a\\"b",le="+Inf"} 3',
+            'latency_seconds_sum{device="a\\"b"} 2.6',
+            'latency_seconds_count{device="a\\"b"} 3',
+            "# HELP sent_total Bytes sent",
+            "# TYPE sent_total counter",
+            'sent_total{device="a\\"b"} 5',
+        ]) + "\n")
+
+    def test_no_labels(self):
+        registry = MetricsRegistry()
+        registry.counter("a").inc()
+        self.assertEqual(prometheus_text(registry), "# TYPE a counter\na 1\n")
+
+    def test_file_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "monocle.prom")
+            registry = sample_registry()
+            PrometheusFileExporter(path).export(registry)
+            with open(path) as f:
+                self.assertEqual(f.read(), prometheus_text(registry))
+            self.assertEqual(os.listdir(directory), ["monocle.prom"])
+
+
+class StatsdExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = StatsdExporter(prefix="m.")
+
+    def tearDown(self):
+        self.exporter.close()
+
+    def test_packets_send_changes_since_last_call(self):
+        registry = sample_registry()
+        self.assertEqual(self.exporter.packets(registry), [
+            "m.latency_seconds.count:3|c",
+            "m.latency_seconds.sum:2.6|g",
+            "m.sent_total:5|c",
+        ])
+        self.assertEqual(self.exporter.packets(registry), [])
+
+        registry.counter("sent_total").inc(2)
+        self.assertEqual(self.exporter.packets(registry), ["m.sent_total:2|c"])
+
+
+class MonocleMetricsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_records_traffic(self):
+        transport = SimulatedTransport(mtu_size=23)
+        metrics = MonocleMetrics()
+        monocle = Monocle(transport=transport, metrics=metrics)
+        async with monocle:
+            await transport.notify(b"hello\r\n")
+            self.assertEqual((metrics.line_length.count, metrics.line_length.sum), (1, 5))
+            await monocle.send("x = 1\n" * 10)
+        self.assertEqual(metrics.bytes_sent.value, transport.bytes_written)
+        self.assertEqual(metrics.chunks_sent.value, transport.packets_written)
+        self.assertEqual(metrics.write_latency.count, transport.packets_written)
+        self.assertEqual(metrics.bytes_received.value, transport.bytes_notified)
+        self.assertEqual(metrics.notifications_received.value, transport.packets_notified)
+
+
+if __name__ == "__main__":
+    unittest.main()
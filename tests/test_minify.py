@@ -0,0 +1,113 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import binascii
+import sys
+import unittest
+from unittest import mock
+from brilliant_monocle_driver.minify import ScriptPreprocessor, compress, minify
+
+SOURCE = '''
+"""Module docstring."""
+# A comment.
+import math
+
+class Shape:
+    """Class docstring."""
+
+    def __init__(self, sides):
+        # Nested blocks several levels deep.
+        self.sides = sides
+        self.labels = []
+        for side in range(sides):
+            if side % 2:
+                while len(self.labels) < side:
+                    self.labels.append(f"odd\\n{side}")
+            else:
+                try:
+                    self.labels.append(f"{side:>3}|{'even'!r}")
+                except ValueError:
+                    pass
+
+
+def only_docstring():
+    """This body is only a docstring."""
+
+
+def area(radius):
+    """Another docstring."""
+    text = """a multi-line
+string that is kept"""
+    return (math.pi * radius ** 2, text)
+
+
+shape = Shape(5)
+result = (shape.labels, only_docstring(), area(2), [n * n for n in range(4) if n])
+'''
+
+
+def run(source):
+    """The value of result after running source, as the device would."""
+    namespace = {}
+    # The device provides ubinascii in place of binascii.
+    with mock.patch.dict(sys.modules, {"ubinascii": binascii}):
+        exec(source, namespace)
+    return namespace["result"]
+
+
+class MinifyTest(unittest.TestCase):
+
+    def test_minified_code_behaves_the_same(self):
+        minified = minify(SOURCE)
+        self.assertLess(len(minified), len(SOURCE))
+        self.assertNotIn("docstring.", minified)
+        self.assertNotIn("#", minified)
+        self.assertEqual(run(minified), run(SOURCE))
+
+    def test_indents_one_space_per_level(self):
+        self.assertEqual(minify("if a:\n    if b:\n        c = 1\n"), "if a:\n if b:\n  c = 1")
+
+    def test_unparsable_source_is_unchanged(self):
+        source = "def broken(:\n    pass\n"
+        self.assertEqual(minify(source), source)
+
+
+class CompressTest(unittest.TestCase):
+
+    def test_compressed_code_behaves_the_same(self):
+        source = minify(SOURCE) + "\n" + "\n".join(
+            "value_{} = {}".format(index, index) for index in range(200))
+        compressed = compress(source)
+        self.assertLess(len(compressed), len(source))
+        self.assertEqual(run(compressed), run(source))
+
+    def test_small_source_is_unchanged(self):
+        self.assertEqual(compress("x = 1"), "x = 1")
+
+
+class ScriptPreprocessorTest(unittest.TestCase):
+
+    def test_results_are_cached(self):
+        preprocessor = ScriptPreprocessor()
+        first = preprocessor.process(SOURCE)
+        self.assertIs(preprocessor.process(SOURCE), first)
+        self.assertEqual(len(preprocessor.cache), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        preprocessor = ScriptPreprocessor(cache_size=2)
+        preprocessor.process("a = 1")
+        preprocessor.process("b = 2")
+        preprocessor.process("a = 1")
+        preprocessor.process("c = 3")
+
+        self.assertEqual(len(preprocessor.cache), 2)
+        self.assertEqual(list(preprocessor.cache.values()), ["a = 1", "c = 3"])
+
+    def test_minify_and_compress(self):
+        source = SOURCE * 10
+        preprocessor = ScriptPreprocessor(compress=True)
+        self.assertEqual(run(preprocessor.process(source)), run(source))
+
+
+if __name__ == "__main__":
+    unittest.main()
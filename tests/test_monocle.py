@@ -0,0 +1,192 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import unittest
+from brilliant_monocle_driver import (Monocle, MonocleException, MpyCompiler, ScriptPreprocessor,
+                                      SimulatedTransport)
+
+
+def echo_handler(script):
+    """Script handler answering each script with its own source, or an error."""
+    if "fail" in script:
+        return "", "Traceback: oops"
+    return "ran {}".format(script.strip())
+
+
+class DroppingTransport(SimulatedTransport):
+    """A SimulatedTransport that drops the link on the drop_on_write'th write."""
+
+    def __init__(self, drop_on_write=None, **kwargs):
+        super().__init__(**kwargs)
+        self.drop_on_write = drop_on_write
+
+    async def write(self, data, response=True):
+        if self.drop_on_write is not None and self.packets_written + 1 == self.drop_on_write:
+            self.drop_on_write = None
+            self.simulate_disconnect()
+        await super().write(data, response)
+
+
+class LateTransport(SimulatedTransport):
+    """
+    A SimulatedTransport whose notifications reach the host delay seconds
+    after the device sends them, in order, so writes return long before the
+    device's answers arrive.
+    """
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.delivery = None
+
+    async def notify(self, data):
+        previous = self.delivery
+
+        async def deliver():
+            if previous is not None:
+                await previous
+            await asyncio.sleep(self.delay)
+            await SimulatedTransport.notify(self, data)
+
+        self.delivery = asyncio.ensure_future(deliver())
+
+
+class ExecuteTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_captures_stdout_and_stderr(self):
+        transport = SimulatedTransport(mtu_size=23, script_handler=echo_handler)
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            result = await monocle.execute("x = 1\n" * 20)
+            self.assertTrue(result.ok)
+            self.assertTrue(result.stdout.startswith("ran x = 1"))
+
+            result = await monocle.execute("fail()")
+            self.assertFalse(result.ok)
+            self.assertEqual(result.stderr, "Traceback: oops")
+
+        self.assertEqual(len(transport.executed_scripts), 2)
+
+    async def test_preprocess_false_skips_preprocessor(self):
+        transport = SimulatedTransport(script_handler=echo_handler)
+        monocle = Monocle(transport=transport, preprocessor=ScriptPreprocessor())
+        async with monocle:
+            await monocle.execute("x  =  1")
+            await monocle.execute("y  =  2", preprocess=False)
+        self.assertEqual(transport.executed_scripts, ["x = 1", "y  =  2"])
+        self.assertEqual(len(monocle.preprocessor.cache), 1)
+
+    async def test_requires_connection(self):
+        monocle = Monocle(transport=SimulatedTransport())
+        with self.assertRaises(MonocleException):
+            await monocle.execute("x = 1")
+
+    async def test_disconnect_while_sending_raises(self):
+        transport = DroppingTransport(drop_on_write=3, mtu_size=23)
+        monocle = Monocle(transport=transport)
+        await monocle.connect()
+        with self.assertRaises(MonocleException):
+            await monocle.execute("x = 1\n" * 50)
+        self.assertFalse(monocle.connected)
+        self.assertEqual(len(monocle.pending_responses), 0)
+        await monocle.disconnect()
+
+    async def test_skips_answers_to_earlier_sends(self):
+        transport = LateTransport(0.05, script_handler=echo_handler)
+        monocle = Monocle(transport=transport, write_without_response=True)
+        async with monocle:
+            await monocle.send("a = 1")
+            async with monocle.batch() as batch:
+                batch.add("b = 2")
+            self.assertEqual(len(monocle.pending_responses), 2)
+
+            result = await monocle.execute("c = 3")
+            self.assertEqual(result.stdout, "ran c = 3")
+            self.assertEqual(len(monocle.pending_responses), 0)
+
+            await monocle.send("d = 4")
+            result = await monocle.execute("e = 5")
+            self.assertEqual(result.stdout, "ran e = 5")
+
+    async def test_late_answer_after_timeout_is_skipped(self):
+        transport = LateTransport(0.1, script_handler=echo_handler)
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            with self.assertRaises(MonocleException):
+                await monocle.execute("a = 1", timeout=0.01)
+            result = await monocle.execute("b = 2")
+            self.assertEqual(result.stdout, "ran b = 2")
+
+
+class ReconnectTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.transport = SimulatedTransport()
+        self.monocle = Monocle(transport=self.transport, auto_reconnect=True)
+        self.monocle.reconnect_initial_delay = 0.01
+        await self.monocle.connect()
+
+    async def asyncTearDown(self):
+        await self.monocle.disconnect()
+
+    async def test_reconnects_and_runs_restore_hooks(self):
+        restored = asyncio.Event()
+
+        async def hook(monocle):
+            restored.set()
+
+        self.monocle.add_restore_hook(hook)
+        self.transport.simulate_disconnect()
+        self.assertFalse(self.monocle.connected)
+
+        await self.monocle.wait_until_connected(1)
+        await asyncio.wait_for(restored.wait(), 1)
+        self.assertEqual(self.monocle.connections, 2)
+        self.assertTrue((await self.monocle.execute("x = 1")).ok)
+
+    async def test_retries_until_device_returns(self):
+        self.transport.available = False
+        self.transport.simulate_disconnect()
+        await asyncio.sleep(0.05)
+        self.assertFalse(self.monocle.connected)
+
+        self.transport.available = True
+        await self.monocle.wait_until_connected(1)
+
+    async def test_failing_restore_step_does_not_stop_later_ones(self):
+        restored = asyncio.Event()
+
+        async def failing_hook(monocle):
+            raise MonocleException("hook failed")
+
+        async def hook(monocle):
+            restored.set()
+
+        self.monocle.add_restore_hook(failing_hook)
+        self.monocle.add_restore_hook(hook)
+        self.transport.simulate_disconnect()
+        await asyncio.wait_for(restored.wait(), 1)
+
+    async def test_failed_helper_install_is_not_restored(self):
+        self.monocle.compiler = MpyCompiler(executable="/nonexistent/mpy-cross")
+        with self.assertRaises(MonocleException):
+            await self.monocle.install_helper("broken", "x = 1", compiled=True)
+        self.assertNotIn("broken", self.monocle.helper_sources)
+
+    async def test_keepalive_notices_silent_drop(self):
+        await self.monocle.disconnect()
+        self.monocle.keepalive_interval = 0.01
+        await self.monocle.connect()
+
+        # The link goes down without the transport reporting it.
+        self.transport.disconnected_callback = None
+        self.transport.simulate_disconnect()
+        self.assertTrue(self.monocle.connected)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.monocle.connections, 3)
+        self.assertTrue(self.monocle.connected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import unittest
+from brilliant_monocle_driver.batched import batched_view
+from brilliant_monocle_driver.raw_repl import (frame_command, ResponseReader, RAW_REPL_BANNER,
+                                               RAW_REPL_END, RAW_REPL_START)
+from brilliant_monocle_driver.records import pack_record
+
+
+class FrameCommandTest(unittest.TestCase):
+
+    def test_frames_and_rewrites_newlines(self):
+        self.assertEqual(bytes(frame_command("a=1\nb=2\n")),
+                         RAW_REPL_START + b"a=1\r\nb=2\r\n" + RAW_REPL_END)
+
+    def test_str_and_bytes_agree(self):
+        command = "print('é')\n\nx = 1"
+        self.assertEqual(frame_command(command), frame_command(command.encode()))
+
+    def test_empty_command(self):
+        self.assertEqual(bytes(frame_command(b"")), RAW_REPL_START + RAW_REPL_END)
+
+    def test_chunks_reassemble_to_frame(self):
+        frame = frame_command("x = 1\n" * 30)
+        chunks = [bytes(chunk) for chunk in batched_view(frame, 20)]
+        self.assertTrue(all(len(chunk) <= 20 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), bytes(frame))
+
+
+class ResponseReaderTest(unittest.TestCase):
+
+    RESPONSE = RAW_REPL_BANNER + b"OKhello\r\n\x04\x04>"
+
+    def test_complete_response(self):
+        reader = ResponseReader()
+        self.assertTrue(reader.input(self.RESPONSE))
+        result = reader.result()
+        self.assertEqual(result.stdout, "hello\r\n")
+        self.assertTrue(result.ok)
+
+    def test_response_split_at_every_byte(self):
+        reader = ResponseReader()
+        done = [reader.input(bytes((byte,))) for byte in self.RESPONSE]
+        self.assertEqual(done.index(True), len(self.RESPONSE) - 2)
+        self.assertEqual(reader.result().stdout, "hello\r\n")
+
+    def test_stderr(self):
+        reader = ResponseReader()
+        reader.input(RAW_REPL_BANNER + b"OK\x04Traceback\x04>")
+        result = reader.result()
+        self.assertEqual(result.stderr, "Traceback")
+        self.assertFalse(result.ok)
+
+    def test_output_before_banner_is_ignored(self):
+        reader = ResponseReader()
+        self.assertFalse(reader.input(b"OK leftover\x04\x04"))
+        self.assertTrue(reader.input(self.RESPONSE))
+        self.assertEqual(reader.result().stdout, "hello\r\n")
+
+    def test_bytes_after_response_are_kept(self):
+        reader = ResponseReader()
+        second = RAW_REPL_BANNER + b"OKnext\x04\x04>"
+        self.assertTrue(reader.input(self.RESPONSE + second))
+        self.assertEqual(reader.result().stdout, "hello\r\n")
+
+        following = ResponseReader()
+        self.assertTrue(following.input(reader.remainder))
+        self.assertEqual(following.result().stdout, "next")
+
+    def test_without_capture_output_is_not_kept(self):
+        reader = ResponseReader(capture=False)
+        self.assertFalse(reader.input(RAW_REPL_BANNER + b"OK" + b"x" * 1000))
+        self.assertEqual(len(reader.buffer), 0)
+        self.assertTrue(reader.input(b"\x04\x04>"))
+
+    def test_skips_records(self):
+        # The payload holds Ctrl-D, which would otherwise end stdout early.
+        record = pack_record(3, b"\x04\x04")
+        reader = ResponseReader(skip_records=True)
+        self.assertTrue(reader.input(RAW_REPL_BANNER + b"OKa" + record + b"b\x04\x04>"))
+        self.assertEqual(reader.result().stdout, "ab")
+
+
+if __name__ == "__main__":
+    unittest.main()
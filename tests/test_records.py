@@ -0,0 +1,90 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import struct
+import unittest
+from brilliant_monocle_driver.exceptions import MonocleException
+from brilliant_monocle_driver.records import (RecordType, RecordParser, RecordRouter, pack_record,
+                                              RECORD_MARKER)
+
+
+class RecordParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        self.parser = RecordParser(lambda type_id, payload: self.records.append(
+            (type_id, payload)))
+
+    def test_text_without_records_passes_through(self):
+        self.assertEqual(self.parser.input(b"hello\r\n"), b"hello\r\n")
+        self.assertEqual(self.records, [])
+
+    def test_record_between_text(self):
+        data = b"before" + pack_record(1, b"\x01\x02\x03") + b"after"
+        self.assertEqual(bytes(self.parser.input(data)), b"beforeafter")
+        self.assertEqual(self.records, [(1, b"\x01\x02\x03")])
+
+    def test_record_split_at_every_byte(self):
+        data = b"a" + pack_record(7, b"payload") + b"b" + pack_record(8, b"") + b"c"
+        text = bytearray()
+        for byte in data:
+            text += self.parser.input(bytes((byte,)))
+        self.assertEqual(bytes(text), b"abc")
+        self.assertEqual(self.records, [(7, b"payload"), (8, b"")])
+
+    def test_payload_containing_marker(self):
+        payload = bytes((RECORD_MARKER, RECORD_MARKER, 0))
+        self.parser.input(pack_record(2, payload))
+        self.assertEqual(self.records, [(2, payload)])
+
+    def test_corrupt_header_is_skipped(self):
+        bad = bytearray(pack_record(1, b"xyz"))
+        bad[4] ^= 0xFF
+        data = bytes(bad) + pack_record(2, b"ok")
+        text = self.parser.input(data)
+        self.assertEqual(self.records, [(2, b"ok")])
+        self.assertEqual(self.parser.invalid, 1)
+        # The rest of the corrupt record is kept as text.
+        self.assertEqual(bytes(text), bytes(bad[1:]))
+
+    def test_corrupt_payload_resynchronises(self):
+        bad = bytearray(pack_record(1, b"xyz"))
+        bad[-2] ^= 0x01
+        data = bytes(bad) + pack_record(2, b"ok")
+        for index in range(0, len(data), 3):
+            self.parser.input(data[index:index + 3])
+        self.assertEqual(self.records, [(2, b"ok")])
+        self.assertEqual(self.parser.invalid, 1)
+
+    def test_truncated_record_resynchronises(self):
+        # A record whose tail was lost, followed by a complete one.
+        truncated = pack_record(1, b"0123456789")[:8]
+        self.parser.input(truncated + pack_record(2, b"ok"))
+        self.assertEqual(self.records, [(2, b"ok")])
+
+
+class RecordRouterTest(unittest.TestCase):
+
+    def test_routes_by_type(self):
+        router = RecordRouter()
+        imu = RecordType(1, "imu", "<hhh")
+        received = []
+        token = router.add(imu, received.append)
+        router.route(1, struct.pack("<hhh", 1, -2, 3))
+        router.route(9, b"")
+        self.assertEqual(received, [(1, -2, 3)])
+        self.assertEqual(router.unknown, 1)
+
+        router.remove(token)
+        router.route(1, struct.pack("<hhh", 1, -2, 3))
+        self.assertEqual(len(received), 1)
+
+    def test_conflicting_type_id(self):
+        router = RecordRouter()
+        router.add(RecordType(1, "imu", "<hhh"), print)
+        with self.assertRaises(MonocleException):
+            router.add(RecordType(1, "other"), print)
+
+
+if __name__ == "__main__":
+    unittest.main()
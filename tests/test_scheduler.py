@@ -0,0 +1,78 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import unittest
+from brilliant_monocle_driver.scheduler import (OutboundScheduler, PRIORITY_HIGH, PRIORITY_NORMAL,
+                                                PRIORITY_BULK)
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waiters_granted_by_priority_then_arrival(self):
+        scheduler = OutboundScheduler()
+        order = []
+
+        async def transaction(name, priority):
+            async with scheduler.transaction(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        await scheduler.acquire()
+        tasks = [asyncio.ensure_future(transaction(name, priority)) for name, priority in [
+            ("bulk", PRIORITY_BULK), ("normal-1", PRIORITY_NORMAL), ("high", PRIORITY_HIGH),
+            ("normal-2", PRIORITY_NORMAL)]]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(order, ["high", "normal-1", "normal-2", "bulk"])
+        self.assertFalse(scheduler.busy)
+
+    async def test_transactions_do_not_overlap(self):
+        scheduler = OutboundScheduler()
+        active = []
+        overlaps = []
+
+        async def transaction():
+            async with scheduler.transaction():
+                active.append(1)
+                overlaps.append(len(active))
+                await asyncio.sleep(0)
+                active.pop()
+
+        await asyncio.gather(*(transaction() for _ in range(10)))
+        self.assertEqual(overlaps, [1] * 10)
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        scheduler = OutboundScheduler()
+        await scheduler.acquire()
+        cancelled = asyncio.ensure_future(scheduler.acquire())
+        waiting = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        scheduler.release()
+        await asyncio.wait_for(waiting, 1)
+        scheduler.release()
+        self.assertFalse(scheduler.busy)
+
+    async def test_waiter_cancelled_when_granted_passes_link_on(self):
+        scheduler = OutboundScheduler()
+        await scheduler.acquire()
+        granted = asyncio.ensure_future(scheduler.acquire())
+        waiting = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+
+        # Grant the link, then cancel the waiter before it resumes.
+        scheduler.release()
+        granted.cancel()
+        await asyncio.gather(granted, return_exceptions=True)
+        await asyncio.wait_for(waiting, 1)
+        scheduler.release()
+        self.assertFalse(scheduler.busy)
+
+
+if __name__ == "__main__":
+    unittest.main()
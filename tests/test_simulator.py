@@ -0,0 +1,65 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import unittest
+from brilliant_monocle_driver import Monocle, MonocleException, SimulatedTransport
+from brilliant_monocle_driver.raw_repl import RAW_REPL_BANNER
+
+
+class SimulatedTransportTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.notified = []
+        self.disconnects = []
+        self.transport = SimulatedTransport(
+            mtu_size=23, script_handler=lambda script: "ran {}".format(script))
+        await self.transport.connect(self.transport.address,
+                                     lambda channel, data: self.notified.append(bytes(data)),
+                                     lambda: self.disconnects.append(True))
+
+    async def test_runs_raw_repl_scripts(self):
+        await self.transport.write(b"\x03\x01x = 1\r\n")
+        await self.transport.write(b"\x04")
+        self.assertEqual(self.transport.executed_scripts, ["x = 1\r\n"])
+        self.assertEqual(b"".join(self.notified),
+                         RAW_REPL_BANNER + b"OKran x = 1\r\n\x04\x04>")
+
+    async def test_notifications_split_at_mtu(self):
+        await self.transport.notify(b"x" * 50)
+        self.assertEqual([len(packet) for packet in self.notified], [20, 20, 10])
+
+    async def test_rejects_writes_larger_than_mtu(self):
+        with self.assertRaises(MonocleException):
+            await self.transport.write(b"x" * 21)
+
+    async def test_ctrl_c_discards_partial_script(self):
+        await self.transport.write(b"\x03\x01partial")
+        await self.transport.write(b"\x03\x01whole\x04")
+        self.assertEqual(self.transport.executed_scripts, ["whole"])
+
+    async def test_simulate_disconnect(self):
+        self.transport.simulate_disconnect()
+        self.assertEqual(self.disconnects, [True])
+        self.assertFalse(self.transport.is_connected)
+        with self.assertRaises(MonocleException):
+            await self.transport.write(b"x")
+
+
+class SimulatedMonocleTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_send_through_monocle(self):
+        transport = SimulatedTransport(mtu_size=23)
+        monocle = Monocle(transport=transport)
+        async with monocle:
+            await monocle.send("a = 1\nb = 2")
+        self.assertEqual(transport.executed_scripts, ["a = 1\r\nb = 2"])
+
+    async def test_connect_to_missing_device_fails(self):
+        transport = SimulatedTransport()
+        transport.available = False
+        with self.assertRaises(MonocleException):
+            await Monocle(transport=transport).connect()
+
+
+if __name__ == "__main__":
+    unittest.main()
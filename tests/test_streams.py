@@ -0,0 +1,84 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import unittest
+from brilliant_monocle_driver import Monocle, SimulatedTransport, DROP_NEWEST, DROP_OLDEST
+from brilliant_monocle_driver.streams import Stream
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+class StreamTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_drop_oldest(self):
+        stream = Stream(3, DROP_OLDEST)
+        for item in range(5):
+            stream.push(item)
+        stream.close()
+        self.assertEqual(await collect(stream), [2, 3, 4])
+        self.assertEqual(stream.dropped, 2)
+
+    async def test_drop_newest(self):
+        stream = Stream(3, DROP_NEWEST)
+        for item in range(5):
+            stream.push(item)
+        stream.close()
+        self.assertEqual(await collect(stream), [0, 1, 2])
+        self.assertEqual(stream.dropped, 2)
+
+    async def test_close_when_full_ends_after_buffered_items(self):
+        stream = Stream(2)
+        stream.push(1)
+        stream.push(2)
+        stream.close()
+        stream.push(3)
+        self.assertEqual(await collect(stream), [1, 2])
+
+    async def test_consumer_waits_for_items(self):
+        stream = Stream()
+        consumer = asyncio.ensure_future(collect(stream))
+        await asyncio.sleep(0)
+        stream.push("a")
+        stream.close()
+        self.assertEqual(await consumer, ["a"])
+
+
+class MonocleStreamsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.transport = SimulatedTransport()
+        self.monocle = Monocle(transport=self.transport)
+        await self.monocle.connect()
+
+    async def test_streams_end_on_disconnect(self):
+        lines = asyncio.ensure_future(collect(self.monocle.lines()))
+        notifications = asyncio.ensure_future(collect(self.monocle.notifications()))
+        await asyncio.sleep(0)
+        await self.transport.notify(b"one\r\ntw")
+        await self.transport.notify(b"o\r\n")
+        await asyncio.sleep(0)
+
+        self.transport.simulate_disconnect()
+        self.assertEqual(await asyncio.wait_for(lines, 1), ["one", "two"])
+        self.assertEqual(await asyncio.wait_for(notifications, 1), [b"one\r\ntw", b"o\r\n"])
+        self.assertEqual(self.monocle.streams, set())
+        self.assertEqual(self.monocle.notification_streams, set())
+
+    async def test_lines_removes_its_listener(self):
+        lines = self.monocle.lines(raw=True)
+        reading = asyncio.ensure_future(lines.__anext__())
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.monocle.raw_line_listeners), 1)
+
+        await self.transport.notify(b"first\r\n")
+        self.assertEqual(await reading, b"first")
+        await lines.aclose()
+        self.assertEqual(self.monocle.raw_line_listeners, {})
+        await self.monocle.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import ast
+import binascii
+import contextlib
+import io
+import os
+import re
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+from brilliant_monocle_driver import Monocle, MonocleException, SimulatedTransport
+from brilliant_monocle_driver.records import pack_record
+from brilliant_monocle_driver.transfer import TRANSFER_DATA, TRANSFER_END
+
+XFER_GET = re.compile(r"^_xfer_get\((.*)\)$", re.MULTILINE)
+
+
+class DeviceFilesystem:
+    """
+    A script_handler running the transfer receiver's functions in this process,
+    against the real filesystem, with CPython's binascii standing in for
+    ubinascii. Other scripts are answered with nothing.
+
+    If drop_on is set, the link drops after the device has run the drop_on'th
+    script carrying blocks, before it answers. If corrupt_on is set, the second
+    block of the corrupt_on'th such script arrives with a wrong CRC.
+    """
+
+    def __init__(self, drop_on=None, corrupt_on=None):
+        self.transport = SimulatedTransport(script_handler=self)
+        self.namespace = {}
+        self.drop_on = drop_on
+        self.corrupt_on = corrupt_on
+        self.block_scripts = []
+
+    def __call__(self, script):
+        if "_xfer" not in script and "os.remove" not in script:
+            return None
+        carries_blocks = script.startswith("_xfer_put(")
+        if carries_blocks:
+            self.block_scripts.append(script)
+            if len(self.block_scripts) == self.corrupt_on:
+                lines = script.splitlines()
+                lines[1] = re.sub(r"\d+\)$", "0)", lines[1])
+                script = "\n".join(lines)
+
+        output = io.StringIO()
+        try:
+            with mock.patch.dict(sys.modules, {"ubinascii": binascii}), \
+                    contextlib.redirect_stdout(output):
+                exec(script, self.namespace)
+        except Exception as e:
+            return output.getvalue(), repr(e)
+
+        if carries_blocks and len(self.block_scripts) == self.drop_on:
+            self.transport.simulate_disconnect()
+        return output.getvalue()
+
+
+class UploadTest(unittest.IsolatedAsyncioTestCase):
+
+    DATA = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "data.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def upload(self, device, auto_reconnect=False):
+        monocle = Monocle(transport=device.transport, auto_reconnect=auto_reconnect)
+        monocle.reconnect_initial_delay = 0.01
+        await monocle.connect()
+        progress = []
+        try:
+            result = await monocle.upload_file(
+                self.DATA, self.path, block_size=1000, reconnect_timeout=1,
+                progress=lambda done, total: progress.append(done))
+        finally:
+            await monocle.disconnect()
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.DATA)
+        self.assertEqual(os.listdir(self.directory.name), ["data.bin"])
+        return result, progress
+
+    async def test_upload(self):
+        device = DeviceFilesystem()
+        result, progress = await self.upload(device)
+        self.assertEqual((result.size, result.transferred), (len(self.DATA), len(self.DATA)))
+        # 11 blocks, four per transaction.
+        self.assertEqual(len(device.block_scripts), 3)
+        self.assertEqual(progress, list(range(1000, len(self.DATA), 1000)) + [len(self.DATA)])
+
+    async def test_resumes_from_partial_file(self):
+        with open(self.path + ".part", "wb") as f:
+            f.write(self.DATA[:2500])
+        device = DeviceFilesystem()
+        result, progress = await self.upload(device)
+        self.assertEqual(result.transferred, len(self.DATA) - 2500)
+        self.assertEqual(progress[0], 3500)
+
+    async def test_restarts_over_unrelated_partial_file(self):
+        with open(self.path + ".part", "wb") as f:
+            f.write(b"something else")
+        result, _ = await self.upload(DeviceFilesystem())
+        self.assertEqual(result.transferred, len(self.DATA))
+
+    async def test_resumes_after_drop(self):
+        device = DeviceFilesystem(drop_on=2)
+        result, _ = await self.upload(device, auto_reconnect=True)
+        # The blocks written before the drop are not sent again.
+        self.assertEqual(result.transferred, len(self.DATA) - 4000)
+        self.assertEqual(len(device.block_scripts), 3)
+
+    async def test_rejected_block_is_resent(self):
+        device = DeviceFilesystem(corrupt_on=1)
+        result, progress = await self.upload(device)
+        self.assertEqual(result.transferred, len(self.DATA))
+        self.assertEqual(progress[:2], [1000, 2000])
+        self.assertEqual(len(device.block_scripts), 4)
+
+
+class FileServingTransport(SimulatedTransport):
+    """
+    A SimulatedTransport answering _xfer_get() for a single file held in
+    memory. If drop_at is set, the first segment containing that offset sends
+    the blocks before it and then the link drops.
+    """
+
+    def __init__(self, data, drop_at=None):
+        super().__init__()
+        self.data = data
+        self.drop_at = drop_at
+        self.requests = []
+
+    async def _execute(self):
+        match = XFER_GET.search(self.script_buffer.decode())
+        if match is None:
+            return await super()._execute()
+        self.script_buffer = bytearray()
+
+        _, offset, length, block = ast.literal_eval(match.group(1))
+        self.requests.append(offset)
+        end = min(offset + length, len(self.data))
+        drop = self.drop_at is not None and offset <= self.drop_at < end
+        output = b"OK"
+        crc = 0
+        for block_offset in range(offset, end, block):
+            if drop and block_offset + block > self.drop_at:
+                break
+            data = self.data[block_offset:block_offset + block]
+            output += pack_record(TRANSFER_DATA.type_id, struct.pack("<I", block_offset) + data)
+            crc = zlib.crc32(data, crc)
+
+        if drop:
+            self.drop_at = None
+            await self.notify(output)
+            self.simulate_disconnect()
+            return
+
+        output += pack_record(TRANSFER_END.type_id, struct.pack("<III", end, len(self.data), crc))
+        await self.notify(output + b"\x04\x04>")
+
+
+class DownloadTest(unittest.IsolatedAsyncioTestCase):
+
+    DATA = bytes(range(256)) * 20
+
+    async def download(self, transport, auto_reconnect=False):
+        monocle = Monocle(transport=transport, auto_reconnect=auto_reconnect)
+        monocle.reconnect_initial_delay = 0.01
+        await monocle.connect()
+        destination = io.BytesIO()
+        try:
+            result = await monocle.download_file("data.bin", destination, block_size=256,
+                                                 segment_size=2048, reconnect_timeout=1,
+                                                 timeout=1)
+        finally:
+            await monocle.disconnect()
+        return result, destination.getvalue()
+
+    async def test_download(self):
+        transport = FileServingTransport(self.DATA)
+        result, data = await self.download(transport)
+        self.assertEqual(data, self.DATA)
+        self.assertEqual(result.size, len(self.DATA))
+        self.assertEqual(transport.requests, [0, 2048, 4096])
+
+    async def test_resumes_after_last_block_written(self):
+        transport = FileServingTransport(self.DATA, drop_at=2048 + 600)
+        result, data = await self.download(transport, auto_reconnect=True)
+        self.assertEqual(data, self.DATA)
+        self.assertEqual(transport.requests, [0, 2048, 2048 + 512, 2048 + 512 + 2048])
+
+    async def test_drop_without_reconnect_raises_promptly(self):
+        transport = FileServingTransport(self.DATA, drop_at=600)
+        with self.assertRaises(MonocleException) as raised:
+            await self.download(transport)
+        self.assertNotIn("Timed out", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
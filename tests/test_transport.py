@@ -0,0 +1,227 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import asyncio
+import os
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+from brilliant_monocle_driver import MonocleException
+from brilliant_monocle_driver.discovery import (DiscoveryCache, NUS_RX_UUID, NUS_SERVICE_UUID,
+                                                NUS_TX_UUID)
+from brilliant_monocle_driver.transport import BleakTransport
+
+OTHER_UUID = "00002a00-0000-1000-8000-00805f9b34fb"
+
+
+class FakeCharacteristic:
+    """Stand-in for a Bleak GATT characteristic."""
+
+    def __init__(self, uuid, handle, properties=("write",), max_write_without_response_size=20):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = list(properties)
+        self.max_write_without_response_size = max_write_without_response_size
+
+
+class FakeService:
+    def __init__(self, characteristics):
+        self.characteristics = characteristics
+
+    def get_characteristic(self, uuid):
+        for characteristic in self.characteristics:
+            if characteristic.uuid == uuid:
+                return characteristic
+        return None
+
+
+class FakeServices:
+    """Stand-in for a Bleak service collection holding the UART service."""
+
+    def __init__(self, characteristics):
+        self.characteristics = {c.handle: c for c in characteristics}
+        self.service = FakeService(characteristics)
+        self.lookups = []
+
+    def get_characteristic(self, handle):
+        self.lookups.append(handle)
+        return self.characteristics.get(handle)
+
+    def get_service(self, uuid):
+        return self.service if uuid == NUS_SERVICE_UUID else None
+
+
+def fake_client_class(characteristics):
+    """A stand-in for BleakClient whose devices expose characteristics."""
+
+    class FakeClient:
+        instances = []
+
+        def __init__(self, address, disconnected_callback=None):
+            self.address = address
+            self.services = FakeServices(characteristics)
+            FakeClient.instances.append(self)
+
+        async def connect(self):
+            pass
+
+    return FakeClient
+
+
+def fake_scanner_class(devices, interval=0.01):
+    """A stand-in for BleakScanner advertising devices, one every interval seconds."""
+
+    class FakeScanner:
+        def __init__(self, detection_callback, service_uuids):
+            self.detection_callback = detection_callback
+
+        async def __aenter__(self):
+            self.task = asyncio.ensure_future(self._advertise())
+
+        async def __aexit__(self, *args):
+            self.task.cancel()
+
+        async def _advertise(self):
+            for address, name in devices:
+                await asyncio.sleep(interval)
+                self.detection_callback(types.SimpleNamespace(address=address, name=name),
+                                        types.SimpleNamespace(local_name=name))
+
+    return FakeScanner
+
+
+class DiscoveryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "nested", "devices.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_remembers_across_instances(self):
+        cache = DiscoveryCache(self.path)
+        self.assertEqual(cache.addresses(), [])
+        cache.remember("AA", 1, 2)
+        cache.remember("BB", 3, 4)
+
+        reloaded = DiscoveryCache(self.path)
+        self.assertEqual(reloaded.addresses(), ["BB", "AA"])
+        self.assertEqual(reloaded.handles("AA"), (1, 2))
+        self.assertIsNone(reloaded.handles("CC"))
+
+    def test_most_recent_first(self):
+        cache = DiscoveryCache(self.path)
+        with mock.patch.object(time, "time", side_effect=[100, 50]):
+            cache.remember("AA", 1, 2)
+            cache.remember("BB", 3, 4)
+        self.assertEqual(cache.addresses(), ["AA", "BB"])
+
+    def test_forget(self):
+        cache = DiscoveryCache(self.path)
+        cache.remember("AA", 1, 2)
+        cache.forget("AA")
+        cache.forget("AA")
+        self.assertEqual(DiscoveryCache(self.path).addresses(), [])
+
+    def test_unreadable_file_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        with self.assertLogs("brilliant_monocle_driver.discovery"):
+            cache = DiscoveryCache(self.path)
+        self.assertEqual(cache.addresses(), [])
+        cache.remember("AA", 1, 2)
+        self.assertEqual(DiscoveryCache(self.path).handles("AA"), (1, 2))
+
+
+class BleakTransportTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DiscoveryCache(os.path.join(self.directory.name, "devices.json"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_default_cache(self):
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.directory.name}):
+            self.assertIsInstance(BleakTransport().cache, DiscoveryCache)
+        self.assertIsNone(BleakTransport(cache=False).cache)
+
+    def test_mtu_size_from_rx_characteristic(self):
+        transport = BleakTransport(cache=False)
+        self.assertIsNone(transport.mtu_size)
+        transport.rx_characteristic = FakeCharacteristic(
+            NUS_RX_UUID, 1, max_write_without_response_size=125)
+        self.assertEqual(transport.mtu_size, 128)
+
+    def test_supports_write_without_response(self):
+        transport = BleakTransport(cache=False)
+        transport.rx_characteristic = FakeCharacteristic(NUS_RX_UUID, 1)
+        self.assertFalse(transport.supports_write_without_response)
+        transport.rx_characteristic = FakeCharacteristic(
+            NUS_RX_UUID, 1, properties=("write", "write-without-response"))
+        self.assertTrue(transport.supports_write_without_response)
+
+    async def get_uart(self, characteristics):
+        client_class = fake_client_class(characteristics)
+        transport = BleakTransport(cache=self.cache)
+        with mock.patch("brilliant_monocle_driver.transport.BleakClient", client_class):
+            _, rx, tx = await transport._get_uart("AA")
+        return client_class.instances[0], rx, tx
+
+    async def test_get_uart_uses_cached_handles(self):
+        self.cache.remember("AA", 11, 12)
+        client, rx, tx = await self.get_uart([FakeCharacteristic(NUS_RX_UUID, 11),
+                                              FakeCharacteristic(NUS_TX_UUID, 12)])
+        self.assertEqual((rx.handle, tx.handle), (11, 12))
+        self.assertEqual(client.services.lookups, [11, 12])
+
+    async def test_get_uart_falls_back_from_stale_handles(self):
+        # The handles now belong to another characteristic, and to none at all.
+        self.cache.remember("AA", 11, 99)
+        client, rx, tx = await self.get_uart([FakeCharacteristic(OTHER_UUID, 11),
+                                              FakeCharacteristic(NUS_RX_UUID, 21),
+                                              FakeCharacteristic(NUS_TX_UUID, 22)])
+        self.assertEqual((rx.uuid, tx.uuid), (NUS_RX_UUID, NUS_TX_UUID))
+        self.assertEqual(self.cache.handles("AA"), (21, 22))
+
+    async def test_get_uart_without_uart_characteristics(self):
+        with self.assertRaises(MonocleException):
+            await self.get_uart([FakeCharacteristic(NUS_RX_UUID, 21)])
+
+    async def find_address(self, devices, **options):
+        transport = BleakTransport(cache=self.cache, **options)
+        with mock.patch("brilliant_monocle_driver.transport.BleakScanner",
+                        fake_scanner_class(devices)):
+            start = time.perf_counter()
+            address = await transport.find_address()
+        return address, time.perf_counter() - start
+
+    async def test_find_address_stops_at_known_device(self):
+        self.cache.remember("BB", 1, 2)
+        address, elapsed = await self.find_address(
+            [("AA", "monocle"), ("BB", "monocle"), ("CC", "monocle")], scan_timeout=5)
+        self.assertEqual(address, "BB")
+        self.assertLess(elapsed, 1)
+
+    async def test_find_address_first_found(self):
+        address, elapsed = await self.find_address(
+            [("XX", "other"), ("AA", "monocle"), ("BB", "monocle")], scan_timeout=5,
+            first_found=True)
+        self.assertEqual(address, "AA")
+        self.assertLess(elapsed, 1)
+
+    async def test_find_address_requires_exactly_one_by_default(self):
+        with self.assertRaises(MonocleException):
+            await self.find_address([("AA", "monocle"), ("BB", "monocle")], scan_timeout=0.1)
+        address, _ = await self.find_address([("AA", "monocle"), ("XX", "other")],
+                                             scan_timeout=0.1)
+        self.assertEqual(address, "AA")
+
+
+if __name__ == "__main__":
+    unittest.main()
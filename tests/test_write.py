@@ -0,0 +1,85 @@
+# Copyright 2023 Mark T. Tomczak
+# License at https://github.com/fixermark/brilliant-monocle-driver-python/blob/main/LICENSE
+
+import unittest
+from brilliant_monocle_driver import Monocle, MonocleException, SimulatedTransport
+from brilliant_monocle_driver.raw_repl import frame_command
+
+SCRIPT = "\n".join("x{} = {}".format(index, index) for index in range(100))
+
+
+class FlakyTransport(SimulatedTransport):
+    """
+    A SimulatedTransport counting writes in flight, whose fail_on'th write
+    without response fails before reaching the device.
+    """
+
+    def __init__(self, fail_on=None, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_on = fail_on
+        self.unacknowledged_writes = 0
+        self.acknowledged_writes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def write(self, data, response=True):
+        if response:
+            self.acknowledged_writes += 1
+        else:
+            self.unacknowledged_writes += 1
+            if self.unacknowledged_writes == self.fail_on:
+                raise MonocleException("Simulated write failure")
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await super().write(data, response)
+        finally:
+            self.in_flight -= 1
+
+
+class PipelinedWriteTest(unittest.IsolatedAsyncioTestCase):
+
+    async def send(self, transport, write_window=Monocle.WRITE_WINDOW):
+        monocle = Monocle(transport=transport, write_without_response=True)
+        monocle.write_window = write_window
+        async with monocle:
+            await monocle.send(SCRIPT)
+        return monocle
+
+    async def test_window_bounds_writes_in_flight(self):
+        transport = FlakyTransport(mtu_size=23, latency=0.001)
+        monocle = await self.send(transport, write_window=3)
+        self.assertEqual(transport.max_in_flight, 3)
+        self.assertEqual(transport.acknowledged_writes, 0)
+        self.assertFalse(monocle.pipelining_failed)
+        self.assertEqual(transport.executed_scripts, [SCRIPT.replace("\n", "\r\n")])
+
+    async def test_failed_write_resends_frame_with_acknowledged_writes(self):
+        transport = FlakyTransport(fail_on=12, mtu_size=23)
+        monocle = await self.send(transport)
+        self.assertTrue(monocle.pipelining_failed)
+        # The whole frame went again, and the partial one was never run.
+        packets = -(-len(frame_command(SCRIPT)) // 20)
+        self.assertEqual(transport.acknowledged_writes, packets)
+        self.assertLess(transport.unacknowledged_writes, packets)
+        self.assertEqual(transport.executed_scripts, [SCRIPT.replace("\n", "\r\n")])
+
+    async def test_later_sends_use_acknowledged_writes(self):
+        transport = FlakyTransport(fail_on=1, mtu_size=23)
+        monocle = Monocle(transport=transport, write_without_response=True)
+        async with monocle:
+            await monocle.send("a = 1")
+            await monocle.send("b = 2")
+        self.assertEqual(transport.unacknowledged_writes, 1)
+        self.assertEqual(transport.executed_scripts, ["a = 1", "b = 2"])
+
+    async def test_acknowledged_writes_without_support(self):
+        transport = FlakyTransport(mtu_size=23, write_without_response=False)
+        await self.send(transport)
+        self.assertEqual(transport.unacknowledged_writes, 0)
+        self.assertEqual(transport.max_in_flight, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()